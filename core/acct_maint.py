@@ -2,12 +2,11 @@
 # -*- coding: utf-8 -*-
 # acct_maint.py - Thursday, June 22, 2023
 """ Follow retweeters and unfollow less-active tweeps """
-__version__ = "0.1.5-dev3"
+__version__ = "0.1.5-dev30"
 
 import builtins
 import click
 import coloredlogs
-import json
 import logging
 import logging.config
 import lzma
@@ -16,18 +15,17 @@ import oyaml as yaml
 import pid
 import snscrape.base
 import snscrape.modules.twitter as sntwitter
+import sqlite3
 import sys
 from collections import Counter
 from datetime import datetime, timedelta, timezone
-from itertools import cycle
 from logging.handlers import RotatingFileHandler
 from os.path import basename, exists, getmtime, join
 from pathlib import Path
-from random import choices, shuffle, uniform
-from requests import get
+from random import choices, shuffle
 from tabulate import tabulate
-from time import sleep
 
+import numpy as np
 import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
 from pid.decorator import pidfile
@@ -36,7 +34,31 @@ from sqlalchemy import create_engine, text
 basedir = Path(__file__).resolve().parent.parent
 if basedir not in sys.path:
 	sys.path.insert(0, str(basedir))
+from archive import (
+	ARCHIVE_TYPES,
+	find_archive_member,
+	find_archive_parts,
+	find_archive_zip,
+	iter_archive_items,
+	iter_zip_items,
+	parse_archive_parts,
+	parse_archive_types,
+	parts_key,
+)
 from config import Config
+from fetch_engine import FetchEngine
+from freshness import FreshnessCache, issue_kind
+from idarray import (
+	as_ids,
+	cached_ids,
+	intersect,
+	read_sidecar,
+	union,
+	write_sidecar,
+)
+from proxypool import ProxyPool, proxies_from_env
+from ratelimit import RateLimiter
+from userstate import UserStates
 
 __module__ = Path(__file__).resolve().stem
 
@@ -47,9 +69,24 @@ if not exists(PIDDIR):
 
 
 @click.command()
+@click.option(
+	"-c",
+	"--concurrency",
+	default=1,
+	show_default=True,
+	help="Profiles fetched at the same time per proxy; starts are still spaced by the search delay",
+)
+@click.option(
+	"-l", "--local", is_flag=True, help="Classify User IDs from the local freshness cache"
+)
+@click.option(
+	"--rebuild-cache", is_flag=True, help="Rebuild the freshness cache from the database"
+)
 @click.argument("twit", nargs=-1)
 @pidfile(piddir=PIDDIR)
-def main(twit):
+def main(concurrency, local, rebuild_cache, twit):
+	if rebuild_cache:
+		user_states.rebuild_freshness()
 	twit_list = list(twit)
 	for _ in range(10):
 		shuffle(twit_list)
@@ -61,57 +98,45 @@ def main(twit):
 		acct_dict = load_account_info(screen_name)
 		acct_id = acct_dict["accountId"]
 		asof = acct_dict["asof"]
-		following_ids = load_friend_ids(screen_name=screen_name)
-		logger.info(f"Following IDs: {len(following_ids):,d}")
-		follower_ids = load_follower_ids(screen_name=screen_name)
-		logger.info(f"Follower IDs : {len(follower_ids):,d}")
+		relation_ids = load_relation_ids(screen_name)
+		following_ids = relation_ids["following"]
+		follower_ids = relation_ids["follower"]
+		if following_ids is None:
+			following_ids = []
+		if follower_ids is None:
+			follower_ids = []
 
-		cached_follower_ids = get_cached_user_ids(follower_ids)
-		cached_following_ids = get_cached_user_ids(following_ids)
-
-		# Update friends / following (Cached)
-		if cached_following_ids:
-			update_relations(acct_id, asof, "following", cached_following_ids)
-
-		# Update followers (Cached)
-		if cached_follower_ids:
-			update_relations(acct_id, asof, "follower", cached_follower_ids)
-
-		# Find User IDs with issues
-		bad_follower_ids = get_bad_user_ids(follower_ids)
-		bad_following_ids = get_bad_user_ids(following_ids)
+		# Classify once per account: cached, bad (recent issue) or to fetch
+		ids = user_states.classify_user_ids(following_ids, follower_ids, local=local)
 
 		# Determine which User IDs to fetch (ie. not cached or current)
-		fetch_follower_ids = sorted(
-			list(set(follower_ids) - set(cached_follower_ids) - set(bad_follower_ids))
+		fetch_user_ids = ids["fetch"]
+		logger.info(
+			f"User IDs cached: {len(ids['cached']):,d}  bad: {len(ids['bad']):,d}  "
+			f"to fetch: {len(fetch_user_ids):,d}"
 		)
-		fetch_following_ids = sorted(
-			list(
-				set(following_ids) - set(cached_following_ids) - set(bad_following_ids)
-			)
-		)
-		# Eliminate duplicates
-		fetch_user_ids = sorted(list(set(fetch_following_ids + fetch_follower_ids)))
-		logger.info(f"User IDs to fetch: {len(fetch_user_ids):,d}")
 
-		if fetch_user_ids:
+		# Relations of users already in dt_user go in before any fetching, so an
+		# aborted fetch loses nothing but the relations of the batch in progress
+		if TEST_MAX_USERS:
+			cached_relations = relation_subset(relation_ids, ids["cached"])
+			merge_relations(acct_id, asof, cached_relations, prune=False)
+		else:
+			# Follows, follower, blocks & mutes in one pass, including
+			# unfollows/unblocks/unmutes since the previous archive
+			merge_relations(acct_id, asof, relation_ids)
+
+		if len(fetch_user_ids):
 			# Testing
 			if TEST_MAX_USERS:
-				# Shuffle list of IDs to fetch and pick first XXX values
-				for _ in range(10):
-					shuffle(fetch_user_ids)
-				fetch_user_ids = fetch_user_ids[:TEST_MAX_USERS]
-				# Reduce following/follower IDs to those in the list, above
-				following_ids = list(
-					set(following_ids).intersection(set(fetch_user_ids))
-				)
-				follower_ids = list(set(follower_ids).intersection(set(fetch_user_ids)))
+				# Shuffle IDs to fetch and pick first XXX values
+				rng = np.random.default_rng()
+				fetch_user_ids = rng.permutation(fetch_user_ids)[:TEST_MAX_USERS]
 				logger.info(f"[TEST] User IDs to fetch: {len(fetch_user_ids)}")
 				for i, fetch_user_id in enumerate(fetch_user_ids):
 					logger.info(f"    {i + 1:4d} {fetch_user_id}")
 			# Fetch profiles for User IDs
 			line_number = 0
-			all_fetched_ids = []
 			batch_size = Config.BATCH_SIZE
 			batches = (
 				fetch_user_ids[i : i + batch_size]
@@ -119,31 +144,15 @@ def main(twit):
 			)
 			for batch_count, batch in enumerate(batches):
 				if batch_count > 0:
-					snoozer(MIN_BATCH_DELAY, MAX_BATCH_DELAY)
-				fetched_ids = fetch_users(batch, line_number)
+					rate_limiter.acquire("user_batch", MIN_BATCH_DELAY, MAX_BATCH_DELAY)
+				fetched_ids = fetch_users(batch.tolist(), line_number, concurrency=concurrency)
+				# Relations of the users just added to dt_user, committed per batch
 				if fetched_ids:
-					fetched_follower_ids = sorted(
-						list(set(follower_ids).intersection(set(fetched_ids)))
-					)
-					fetched_following_ids = sorted(
-						list(set(following_ids).intersection(set(fetched_ids)))
-					)
-
-					# Update friends / following (Fetched)
-					if fetched_following_ids:
-						update_relations(
-							acct_id, asof, "following", fetched_following_ids
-						)
-
-					# Update followers (Fetched)
-					if fetched_follower_ids:
-						update_relations(
-							acct_id, asof, "follower", fetched_follower_ids
-						)
-
-					# ToDo: blocked & muted
-					line_number += batch_size
-					do_nothing()
+					fetched_relations = relation_subset(relation_ids, fetched_ids)
+					merge_relations(acct_id, asof, fetched_relations, prune=False)
+				line_number += batch_size
+				do_nothing()
+	user_states.schedule_refreshes()
 	return
 
 
@@ -153,29 +162,31 @@ def init():
 		msg += " (DRY RUN)"
 	logger.info(msg)
 
-	proxy = os.getenv("ALL_PROXY")
-	if proxy:
-		print(f"ALL_PROXY = {proxy}")
-	# Check IP Address being used
-	check_ip_pool = cycle(Config.MYIP_URLS_HTTPS)
-	retries = 3
-	while retries > 0:
-		try:
-			url = next(check_ip_pool)
-			r = get(url, timeout=(3.05, 30))
-			if r.ok:
-				logger.info(f"IP Address: {r.text.rstrip()} via {url}")
-			retries = -1
-		except Exception as e:
-			retries -= 1
-			if retries > 0:
-				logger.warning(e)
-			else:
-				logger.exception(e)
-			do_nothing()
+	# Check the IP Address each proxy egresses from, all at once
+	for label, stats in proxy_pool.check().items():
+		if stats.ejected_at is None:
+			logger.info(f"IP Address: {stats.ip} via {label} ({stats.latency:.2f}s)")
+		else:
+			logger.warning(f"Proxy {label} ejected: {stats.last_error}")
 	return
 
 
+def archive_source(screen_name: str) -> tuple:
+	"""
+	:return: (archive zip or extracted data directory, directory for ID sidecars),
+		or (None, None) if the account has no archive
+	"""
+	cache_dir = twitter_data_dir / f"{screen_name}"
+	zip_path = find_archive_zip(twitter_data_dir, screen_name)
+	if zip_path:
+		cache_dir.mkdir(parents=True, exist_ok=True)
+		return zip_path, cache_dir
+	data_dir = cache_dir / "data"
+	if exists(data_dir):
+		return data_dir, data_dir
+	return None, None
+
+
 def eoj():
 	stop_dt = datetime.now().astimezone().replace(microsecond=0)
 	duration = stop_dt.replace(microsecond=0) - _run_dt.replace(microsecond=0)
@@ -183,7 +194,34 @@ def eoj():
 	return
 
 
-def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
+def fetch_user(user_id: int, proxies: dict = None) -> tuple:
+	"""
+	Blocking snscrape lookup, run on a FetchEngine worker thread
+	:param proxies: from the proxy pool; None goes direct (or via ALL_PROXY)
+	:return: (entity, last_tweeted, url)
+	"""
+	user = sntwitter.TwitterUserScraper(user_id, proxies=proxies)
+	entity = user.entity
+
+	if entity.link:
+		url = entity.link.url
+	else:
+		url = None
+	last_tweeted = None
+	i, tweet = -1, None
+	for i, tweet in enumerate(user.get_items()):
+		last_tweeted = tweet.date
+		if i == 1:
+			break
+	return entity, last_tweeted, url
+
+
+def fetch_users(user_ids: list | set, lineno: int = 0, concurrency: int = 1) -> list:
+	"""
+	Fetches profiles on `concurrency` workers per healthy proxy, each proxy spaced by
+	the search delay range in its own rate bucket, and records each one with
+	insert_user() / insert_issue() as it completes
+	"""
 	fetched_ids = []
 	no_tweet_ids = []
 	error_ids = []
@@ -202,24 +240,11 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 	for _ in range(10):
 		shuffle(user_ids)
 
-	# Fetch User IDs
-	for count, user_id in enumerate(user_ids):
-		if count > 0:
-			sleep(uniform(MIN_SEARCH_DELAY, MAX_SEARCH_DELAY))
-		try:
-			user = sntwitter.TwitterUserScraper(user_id)
-			entity = user.entity
-
-			if entity.link:
-				url = entity.link.url
-			else:
-				url = None
-			last_tweeted = None
-			i, tweet = -1, None
-			for i, tweet in enumerate(user.get_items()):
-				last_tweeted = tweet.date
-				if i == 1:
-					break
+	def record_result(result):
+		nonlocal consecutive_error_count
+		count, user_id = result.index, result.user_id
+		if result.error is None:
+			entity, last_tweeted, url = result.value
 			if not last_tweeted:
 				# Protected or shadow-banned account?
 				no_tweet_ids.append(user_id)
@@ -233,7 +258,7 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 				logger.warning(msg)
 				insert_issue(user_id, _run_dt, False, True, False, msg)
 			logger.debug(f"{lineno+count+1:5d}) {user_id:19d} Adding to database . . .")
-			good_id = insert_user(
+			insert_user(
 				user_id=int(entity.id),
 				asof=_run_dt,  # AsOf
 				username=entity.username,
@@ -255,10 +280,12 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 				image_url=entity.profileImageUrl,
 				banner_url=entity.profileBannerUrl,
 			)
-			fetched_ids.append(good_id)
+			# insert_user() returns None for an unchanged profile, which was still fetched
+			fetched_ids.append(user_id)
 			consecutive_error_count = 0
 			do_nothing()
-		except snscrape.base.ScraperException as e:
+		elif isinstance(result.error, snscrape.base.ScraperException):
+			e = result.error
 			consecutive_error_count += 1
 			error_ids.append(user_id)
 			msg = " ".join(
@@ -278,7 +305,29 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 				insert_issue(user_id, _run_dt, False, False, False, msg)
 			if consecutive_error_count == 25:
 				raise Exception("Too many errors.  Aborting.")
-		# snoozer(MIN_ERROR_DELAY, MAX_ERROR_DELAY)
+		else:
+			raise result.error
+		return
+
+	# Fetch User IDs
+	proxies = proxy_pool.healthy()
+	if not proxies:
+		# Every proxy was ejected; readmit any that have recovered
+		proxy_pool.check()
+		proxies = proxy_pool.healthy()
+		if not proxies:
+			raise Exception("No healthy proxies.  Aborting.")
+	fetch_engine = FetchEngine(
+		proxy_pool.wrap(fetch_user, is_proxy_error=is_proxy_error),
+		concurrency=concurrency * len(proxies),
+		delay_range=(MIN_SEARCH_DELAY, MAX_SEARCH_DELAY),
+		identities=proxies,
+		endpoint="user",
+		limiter=rate_limiter,
+		health=proxy_pool.is_healthy,
+		error_delay_range=(MIN_ERROR_DELAY, MAX_ERROR_DELAY),
+	)
+	fetch_engine.run_sync(user_ids, on_result=record_result)
 	return fetched_ids
 
 
@@ -293,102 +342,6 @@ def find_logging_config() -> str | None:
 	return logging_config
 
 
-def get_cached_users(user_ids):
-	user_ids = sorted(user_ids)
-	tablename = "dt_user"
-	columns = [
-		"user_id",
-		"asof",
-		"username",
-		"displayname",
-		"created_at",
-		"followers_count",
-		"friends_count",
-		"listed_count",
-		"statuses_count",
-		"last_tweeted",
-	]
-	where_clause = "asof > :since"
-	order_by = "asof DESC"
-	params = {"since": (_run_dt.replace(microsecond=0) - timedelta(days=CACHE_DAYS))}
-	sql = f"SELECT * FROM {tablename} WHERE {where_clause} ORDER BY {order_by};"
-	with engine.connect() as conn:
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-
-		where_conditions = [
-			"user_id IN (%s)" % stringify(user_ids),
-			"asof > '%s'" % (_run_dt.replace(microsecond=0) - timedelta(hours=24)),
-		]
-		where_clause = " AND ".join(where_conditions)
-		orderby_clause = "user_id"
-
-		sql = "SELECT DISTINCT * FROM %s WHERE %s ORDER BY %s LIMIT 100000;" % (
-			tablename,
-			where_clause,
-			orderby_clause,
-		)
-		print(sql)
-		rows = conn.execute(text(sql))
-		row_count = rows.rowcount
-		print("Row Count: {:,d}".format(row_count))
-		# df = pd.DataFrame(rows, columns=rows.keys())
-	return pd.DataFrame(rows, columns=rows.keys())
-
-
-# ToDo: Should this be using dt_user_history?
-def get_cached_user_ids(user_ids):
-	user_ids = sorted(user_ids)
-	cached_user_ids = []
-	with engine.connect() as conn:
-		tablename = "dt_user"
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-		params = {
-			"since": (_run_dt.replace(microsecond=0) - timedelta(days=CACHE_DAYS))
-		}
-		# Columns: ['user_id', 'asof', 'screen_name', 'name', 'created_at', 'default_profile_image', 'protected', 'followers_count', 'friends_count', 'listed_count', 'statuses_count', 'last_tweet']
-		where_conditions = [
-			"user_id IN (%s)" % stringify(user_ids),
-			"asof > :since",
-		]
-		where_clause = " AND ".join(where_conditions)
-		orderby_clause = "user_id"
-		sql = f"SELECT DISTINCT user_id FROM {tablename} WHERE {where_clause} ORDER BY {orderby_clause};"
-		# logger.info(sql)
-		for row in conn.execute(text(sql), params).fetchall():
-			cached_user_ids.append(row[0])
-		row_count = len(cached_user_ids)
-		# df = pd.DataFrame(rows, columns=rows.keys())
-	return cached_user_ids
-
-
-def get_bad_user_ids(user_ids):
-	user_ids = sorted(user_ids)
-	bad_user_ids = []
-
-	with engine.connect() as conn:
-		tablename = "dt_issue"
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-		params = {
-			"since": (_run_dt.replace(microsecond=0) - timedelta(days=CACHE_DAYS))
-		}
-		# Columns: ['user_id', 'asof', 'screen_name', 'name', 'created_at', 'default_profile_image', 'protected', 'followers_count', 'friends_count', 'listed_count', 'statuses_count', 'last_tweet']
-		where_conditions = [
-			"user_id IN (%s)" % stringify(user_ids),
-			"asof > :since",
-		]
-		where_clause = " AND ".join(where_conditions)
-		orderby_clause = "user_id"
-		sql = f"SELECT DISTINCT user_id FROM {tablename} WHERE {where_clause} ORDER BY {orderby_clause};"
-		# logger.info(sql)
-		for row in conn.execute(text(sql), params).fetchall():
-			bad_user_ids.append(row[0])
-		row_count = len(bad_user_ids)
-	return bad_user_ids
-
-
 def get_follower_ids(user_id=None, screen_name=None):
 	return load_ids(id_type="follower", user_id=user_id, screen_name=screen_name)
 
@@ -399,11 +352,15 @@ def load_account_info(screen_name: str) -> dict:
 	- Uses timestamp of the archive to obtain 'asof' date
 	"""
 	acct_dict = {}
-	filename = twitter_data_dir / f"{screen_name}" / "data" / f"account.js"
-	asof = datetime.fromtimestamp(getmtime(filename)).astimezone()
-	with open(filename) as fp:
-		data = fp.read().lstrip("window.YTD.account.part0 = ")
-		acct_dict = json.loads(data)[0]["account"]
+	zip_path = find_archive_zip(twitter_data_dir, screen_name)
+	if zip_path:
+		member = find_archive_member(zip_path, "account.js")
+		asof = datetime.fromtimestamp(getmtime(zip_path)).astimezone()
+		acct_dict = next(iter_zip_items(zip_path, member))["account"]
+	else:
+		filename = twitter_data_dir / f"{screen_name}" / "data" / f"account.js"
+		asof = datetime.fromtimestamp(getmtime(filename)).astimezone()
+		acct_dict = next(iter_archive_items(filename))["account"]
 	acct_dict.update({"asof": asof})
 	return acct_dict
 
@@ -430,16 +387,18 @@ def load_ids(id_type, user_id=None, screen_name=None):
 		)
 	if id_type == "friend":
 		id_type = "following"
+	basename, item_key = ARCHIVE_TYPES[id_type]
 	# filename = data_dir / f"{screen_name}_following.js"
-	filename = twitter_data_dir / f"{screen_name}" / "data" / f"{id_type}.js"
+	filename = twitter_data_dir / f"{screen_name}" / "data" / f"{basename}.js"
 	friendly_id_type = str(id_type).capitalize()
 	# fn_logger = logging.getLogger("%s.get_%s_ids" % (__module__, id_type))
 	logger.info(f"Filename: {filename}")
 	ids = []
 	id_key = "accountId"
-	if exists(filename):  # and _run_dt.timestamp() - getmtime(filename) < 12 * 60**2:
-		ids = load_ids_file(id_type, id_key, filename)
-	if not ids:
+	source, cache_dir = archive_source(screen_name)
+	if source:
+		ids = load_ids_file(basename, item_key, id_key, source, cache_dir)
+	if not len(ids):
 		logger.debug("Fetching %s IDs for @%s . . ." % (friendly_id_type, screen_name))
 	return ids
 
@@ -486,6 +445,10 @@ def insert_issue(
 		conn.execute(text(setschema))
 		seen_id = conn.execute(text(sql), params_dict).fetchone()[0]
 		do_nothing()
+	try:
+		freshness.record_issue(user_id, asof, issue_kind(no_response, no_tweets, no_user))
+	except sqlite3.Error as e:
+		logger.warning(f"Freshness cache not updated for {user_id}: {e}")
 
 	return seen_id
 
@@ -543,32 +506,148 @@ def insert_user(
 		setschema = f"SET search_path TO {schema},public;"
 		conn.execute(text(setschema))
 		seen_id = conn.execute(text(sql), params_dict).fetchone()[0]
+		if not seen_id:
+			# Unchanged profile: dt_user isn't written, but the fetch still counts
+			sql = "SELECT fn_user_fetched(:in_user_id, :asof);"
+			conn.execute(text(sql), params_dict)
 		do_nothing()
+	try:
+		freshness.record_user(user_id, asof)
+	except sqlite3.Error as e:
+		logger.warning(f"Freshness cache not updated for {user_id}: {e}")
 	return seen_id
 
 
-def load_ids_file(id_type, id_key, filename):
-	ids = []
-	with open(filename) as fp:
-		# data = json.load(infile)
-		data = fp.read().lstrip(f"window.YTD.{id_type}.part0 = ")
-		ids_dict = json.loads(data)
-
-	do_nothing()
-	for item in ids_dict:
-		if id_type in item:
-			if id_key in item[id_type]:
-				acct_id = item[id_type][id_key]
-				try:
-					acct_id = int(acct_id)
-				except Exception as e:
-					logger.exception(e)
-				# logger.info(acct_id)
-				ids.append(acct_id)
-				do_nothing()
+def is_proxy_error(e: Exception) -> bool:
+	"""
+	A missing or suspended user is the answer, not a failure of the proxy it came through
+	"""
+	if isinstance(e, snscrape.base.ScraperException) and "User" in e.args:
+		return False
+	return True
+
+
+def load_ids_file(basename, item_key, id_key, source, cache_dir):
+	"""
+	Parses every part of data/{basename}.js (part0, -part1, ...) from the archive zip or
+	extracted data directory, one worker process per part, and merges them.
+	The result is kept in a sidecar under cache_dir, keyed by all the parts' CRCs (zip)
+	or mtimes (files) and sizes; later runs memory-map it until any part changes
+	:return: sorted int64 array of de-duplicated IDs
+	"""
+	parts = find_archive_parts(source, basename)
+	if not parts:
+		logger.warning(f"{source}: no {basename}.js")
+		return []
+	ids = cached_ids(
+		source,
+		lambda: union(*(as_ids(x) for x in parse_archive_parts(parts, item_key, id_key))),
+		sidecar=Path(cache_dir) / f"{basename}.js.ids",
+		key=parts_key(parts),
+	)
+	logger.debug(f"{len(ids):,d} {basename} IDs read from {len(parts)} part(s) in {source}")
 	return ids
 
 
+def load_relation_ids(screen_name: str) -> dict:
+	"""
+	Loads following, follower, blocked and muted IDs from the archive, parsing the
+	parts of every type that has changed in one worker pool.  Unchanged types are
+	memory-mapped from their sidecars
+	:return: {id_type: sorted int64 array, or None if the archive has no such file}
+	"""
+	relation_ids = {x: None for x in ARCHIVE_TYPES}
+	source, cache_dir = archive_source(screen_name)
+	if not source:
+		logger.warning(f"No archive for @{screen_name}")
+		return relation_ids
+	tasks = {}
+	sidecars = {}
+	for id_type, (basename, item_key) in ARCHIVE_TYPES.items():
+		parts = find_archive_parts(source, basename)
+		if not parts:
+			continue
+		key = parts_key(parts)
+		sidecar = Path(cache_dir) / f"{basename}.js.ids"
+		ids = read_sidecar(sidecar, key)
+		if ids is None:
+			tasks[id_type] = (parts, item_key, "accountId")
+			sidecars[id_type] = (sidecar, key)
+		else:
+			relation_ids[id_type] = ids
+	for id_type, arrays in parse_archive_types(tasks).items():
+		ids = union(*(as_ids(x) for x in arrays))
+		sidecar, key = sidecars[id_type]
+		write_sidecar(sidecar, key, ids)
+		relation_ids[id_type] = ids
+	for id_type, ids in relation_ids.items():
+		count = "-" if ids is None else f"{len(ids):,d}"
+		logger.info(f"{id_type.capitalize():9s} IDs: {count}")
+	return relation_ids
+
+
+def merge_relations(
+	acct_id: int, asof: datetime, relation_ids: dict, prune: bool = True
+) -> dict:
+	"""
+	Applies an archive snapshot to dt_relation in one upsert (fn_relation_merge): one
+	row, and one history row, per pair with its follows, blocks and mutes together.
+	Types missing from the archive (None, or empty when pruning) are left as they are.
+	Only users already in dt_user are related
+	:param prune: relation_ids is the whole snapshot, so relations missing from it have
+		ended; pass False for part of it, eg. from relation_subset()
+	:return: counts of relations inserted, updated, unchanged and pruned
+	"""
+	params = {"acct_id": acct_id, "asof": asof, "prune": prune}
+	for id_type, param in (
+		("following", "following"),
+		("follower", "followers"),
+		("blocked", "blocking"),
+		("muted", "muting"),
+	):
+		ids = relation_ids.get(id_type)
+		if ids is None or (prune and not len(ids)):
+			params[param] = None
+		else:
+			params[param] = [int(x) for x in ids]
+	sql = """
+		SELECT * FROM fn_relation_merge(
+			:acct_id,
+			CAST(:following AS BIGINT[]),
+			CAST(:followers AS BIGINT[]),
+			CAST(:blocking AS BIGINT[]),
+			CAST(:muting AS BIGINT[]),
+			:asof,
+			:prune
+		);
+	""".strip()
+	with engine.begin() as conn:
+		setschema = f"SET search_path TO {schema},public;"
+		conn.execute(text(setschema))
+		inserted, updated, unchanged, pruned = conn.execute(text(sql), params).fetchone()
+	logger.info(
+		f"Relations: {inserted:,d} inserted, {updated:,d} updated, "
+		f"{unchanged:,d} unchanged, {pruned:,d} pruned"
+	)
+	return {
+		"inserted": inserted,
+		"updated": updated,
+		"unchanged": unchanged,
+		"pruned": pruned,
+	}
+
+
+def relation_subset(relation_ids: dict, user_ids) -> dict:
+	"""
+	The part of an archive snapshot that concerns user_ids, for
+	merge_relations(prune=False); types missing from the archive stay None
+	"""
+	user_ids = as_ids(user_ids)
+	return {
+		k: None if v is None else intersect(v, user_ids) for k, v in relation_ids.items()
+	}
+
+
 def save_ids(filename, ids):
 	# fn_logger = logging.getLogger(__module__ + ".save_ids")
 	lines = []
@@ -589,84 +668,11 @@ def save_ids(filename, ids):
 	return
 
 
-def snoozer(min_sleep, max_sleep=None):
-	"""
-	Sleep for for a specified amount of time; if max_sleep is specified,
-	a random number is generated
-	:param min_sleep: The minimum amount of time to sleep
-	:param max_sleep: The maximum amount of time to sleep, if supplied
-	:return: None
-	"""
-	# fn_logger = logging.getLogger("%s.snoozer" % __module__)
-	if type(min_sleep) not in [int, float]:
-		raise ValueError("min_sleep should be an int or float")
-	if max_sleep:
-		if type(max_sleep) not in [int, float]:
-			raise ValueError("max_sleep should be an int or float")
-		sleep_seconds = abs(uniform(min_sleep, max_sleep))
-	else:
-		sleep_seconds = abs(min_sleep)
-	start_ts = datetime.now().timestamp()
-	logger.debug("sleep(%f)" % sleep_seconds)
-	sleep(sleep_seconds)
-	stop_ts = datetime.now().timestamp()
-	actual_sleep = stop_ts - start_ts
-	if actual_sleep < sleep_seconds:
-		raise Exception("actual sleep less than requested sleep")
-	return
-
-
 def stringify(iterable, separator=","):
 	iterable = separator.join([str(x) for x in iterable])
 	return iterable
 
 
-# ToDo: Change database function(s) to handle follow/unfollow, block/unblock, and mute/unmute operations
-def update_relations(acct_id: int, asof: datetime, relation_type: str, user_ids: list):
-	"""
-	Updates dt_relation; Both acct_id and user_id must exist in dt_user, beforehand
-	"""
-	if relation_type not in ["follower", "following", "friend", "blocked", "muted"]:
-		raise ValueError(f"Unrecognized relation type: '{relation_type}'")
-	if not user_ids:
-		raise ValueError("Nothing to process")
-	# ToDo: Follower IDs
-	operation = None
-	if relation_type in ["follower", "following", "friend"]:
-		operation = "follow"
-	elif relation_type == "blocked":
-		operation = "block"
-	elif relation_type == "muted":
-		operation = "mute"
-	else:
-		raise ValueError(f"Unrecognized relation type: '{relation_type}'")
-	with engine.begin() as conn:
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-		# Columns: user_id1, user_id2, asof, follows, blocked, muted
-		for user_id in user_ids:
-			params = {
-				"operation": operation,
-				"in_user_id1": acct_id,
-				"in_user_id2": user_id,
-				"asof": asof,
-			}
-			if relation_type == "follower":
-				params.update(
-					{
-						"in_user_id1": user_id,
-						"in_user_id2": acct_id,
-					}
-				)
-			sql = "SELECT * FROM fn_relation(:operation, :in_user_id1, :in_user_id2, :asof);"
-			results = conn.execute(text(sql), params)
-			do_nothing()
-
-		# ToDo: Process User IDs no longer related
-
-	return
-
-
 def do_nothing():
 	pass
 
@@ -699,6 +705,10 @@ if __name__ == "__main__":
 	twitter_data_dir = Config.TWITTER_DATA_DIR
 	user_cache = Config.USER_CACHE
 
+	freshness = FreshnessCache(Path(cache_dir) / "freshness.sqlite3")
+	rate_limiter = RateLimiter()
+	proxy_pool = ProxyPool(proxies_from_env(), Config.MYIP_URLS_HTTPS)
+
 	# Database Stuff
 	# DATABASE_URL = Config.DATABASE_URL
 	db_url = Config.SQLALCHEMY_DATABASE_URI
@@ -711,6 +721,7 @@ if __name__ == "__main__":
 
 	# Tweet-related Configuration
 	CACHE_DAYS = Config.CACHE_DAYS
+	user_states = UserStates(engine, schema, freshness, cache_dir, CACHE_DAYS, _run_dt)
 	MIN_BATCH_DELAY, MAX_BATCH_DELAY = Config.BATCH_DELAY_RANGE
 	MIN_ERROR_DELAY, MAX_ERROR_DELAY = Config.ERROR_DELAY_RANGE
 	MIN_SEARCH_DELAY, MAX_SEARCH_DELAY = Config.SEARCH_DELAY_RANGE
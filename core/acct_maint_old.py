@@ -3,7 +3,7 @@
 # acct_maint_old.py - Saturday, September 4, 2021
 """ Follow retweeters and unfollow less-active tweeps """
 """ ToDo: Load cached data from database """
-__version__ = "0.9.107-dev1"
+__version__ = "0.9.107-dev4"
 
 import builtins
 import click
@@ -25,7 +25,6 @@ from os.path import basename, exists, getmtime, join
 from pathlib import Path
 from random import shuffle, uniform
 from tabulate import tabulate
-from time import sleep
 
 import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
@@ -36,6 +35,8 @@ basedir = Path(__file__).resolve().parent.parent
 if basedir not in sys.path:
 	sys.path.insert(0, str(basedir))
 from config import Config
+from proxypool import proxy_label
+from ratelimit import RateLimiter, bucket_name, sleep_for
 
 __module__ = Path(__file__).resolve().stem
 
@@ -82,7 +83,7 @@ def main(screen_name, csv, database, first_run):
 	)
 	for batch_count, batch in enumerate(batches):
 		if batch_count > 0:
-			snoozer(MIN_BATCH_DELAY, MAX_BATCH_DELAY)
+			rate_limiter.acquire("user_batch", MIN_BATCH_DELAY, MAX_BATCH_DELAY)
 		following_users = get_users(batch, csv, database, line_number)
 		line_number += batch_size
 		do_nothing()
@@ -258,8 +259,7 @@ def get_users(user_ids, csv, database, lineno=0):
 	tweets = []
 	idlers = []
 	for count, user_id in enumerate(user_ids):
-		if count > 0:
-			sleep(uniform(3.3333, 7.7777))
+		rate_limiter.acquire(user_bucket, 3.3333, 7.7777)
 		retries = 3
 		while retries > 0:
 			flag_list = []
@@ -330,7 +330,7 @@ def get_users(user_ids, csv, database, lineno=0):
 					continue
 				else:
 					logger.warning(f"User ID: {user_id}: {e}  Retries: {retries}")
-					snoozer(395, 405)
+					sleep_for(uniform(395, 405))
 	columns = [
 		"user_id",
 		"asof",
@@ -420,33 +420,6 @@ def save_ids(filename, ids):
 	return
 
 
-def snoozer(min_sleep, max_sleep=None):
-	"""
-	Sleep for for a specified amount of time; if max_sleep is specified,
-	a random number is generated
-	:param min_sleep: The minimum amount of time to sleep
-	:param max_sleep: The maximum amount of time to sleep, if supplied
-	:return: None
-	"""
-	# fn_logger = logging.getLogger("%s.snoozer" % __module__)
-	if type(min_sleep) not in [int, float]:
-		raise ValueError("min_sleep should be an int or float")
-	if max_sleep:
-		if type(max_sleep) not in [int, float]:
-			raise ValueError("max_sleep should be an int or float")
-		sleep_seconds = abs(uniform(min_sleep, max_sleep))
-	else:
-		sleep_seconds = abs(min_sleep)
-	start_ts = datetime.now().timestamp()
-	logger.debug("sleep(%f)" % sleep_seconds)
-	sleep(sleep_seconds)
-	stop_ts = datetime.now().timestamp()
-	actual_sleep = stop_ts - start_ts
-	if actual_sleep < sleep_seconds:
-		raise Exception("actual sleep less than requested sleep")
-	return
-
-
 def stringify(iterable, separator=","):
 	iterable = separator.join([str(x) for x in iterable])
 	return iterable
@@ -525,6 +498,11 @@ if __name__ == "__main__":
 	MIN_BATCH_DELAY, MAX_BATCH_DELAY = Config.BATCH_DELAY_RANGE
 	MIN_SEARCH_DELAY, MAX_SEARCH_DELAY = Config.SEARCH_DELAY_RANGE
 
+	# Rate-limit buckets shared with other jobs
+	rate_limiter = RateLimiter()
+	# snscrape goes out through ALL_PROXY (or direct), like a pool of one
+	user_bucket = bucket_name("user", proxy_label(os.getenv("ALL_PROXY")))
+
 	NEW_FRIEND_LIMIT = Config.NEW_FRIEND_LIMIT
 	MIN_LISTED_COUNT = Config.MIN_LISTED_COUNT
 	MIN_STATUS_COUNT = Config.MIN_STATUS_COUNT
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 # acct_maint.py - Saturday, September 4, 2021
 """ Follow retweeters and unfollow less-active tweeps """
-__version__ = '0.8.89'
+__version__ = '0.8.90'
 
 import builtins, click, logging, os, lzma, pid, sys, tweepy
 import pandas as pd
@@ -12,13 +12,14 @@ from logging.handlers import RotatingFileHandler, SMTPHandler
 from os.path import basename, exists, expanduser, getmtime, join, splitext
 from pid.decorator import pidfile
 from PIL import Image, ImageDraw, ImageFont
-from random import shuffle, uniform
+from random import shuffle
 from sqlalchemy import create_engine, select, text
 from sqlalchemy.orm import Session
 from time import sleep
 
 from config import Config
 from models import RcFile, User
+from ratelimit import RateLimiter, bucket_name
 
 __MODULE__ = os.path.splitext(os.path.basename(__file__))[0]
 
@@ -184,7 +185,7 @@ def find_new_friends(screen_name, exisisting_friend_ids, make_changes):
 		earliest_tweet_date = min([x.created_at for x in retweets_of_me])
 		# Find more retweets of me if we have less than a week's worth of tweets
 		while earliest_tweet_date > last_week_dt:
-			snoozer(MIN_BATCH_DELAY, MAX_BATCH_DELAY)
+			rate_limiter.acquire(bucket_name("batch", tacct), MIN_BATCH_DELAY, MAX_BATCH_DELAY)
 			fn_logger.debug('Fetching more retweets of @%s: %d so far (max_id=%d) . . .' % (tacct, len(retweets_of_me), max_id))
 			page = api.get_retweets_of_me(count=100, max_id=max_id, trim_user=True)
 			if page:
@@ -201,7 +202,7 @@ def find_new_friends(screen_name, exisisting_friend_ids, make_changes):
 			next_cursor = -1
 			try:
 				while True:
-					snoozer(MIN_SEARCH_DELAY, MAX_SEARCH_DELAY)
+					rate_limiter.acquire(bucket_name("search", tacct), MIN_SEARCH_DELAY, MAX_SEARCH_DELAY)
 					# The next_cursor functionality doesn't seem to be working, at the Twitter API level
 					fn_logger.debug("%3d) Fetching Retweeter IDs for tweet %d (cursor=%d) . . ." % (rt_count, rt.id, next_cursor))
 					ids, cursors = api.get_retweeter_ids(rt.id, cursor=next_cursor)
@@ -241,7 +242,7 @@ def find_new_friends(screen_name, exisisting_friend_ids, make_changes):
 		for user in users:
 			loop_count += 1
 			if loop_count > 1:
-				snoozer(MIN_SEARCH_DELAY, MAX_SEARCH_DELAY)
+				rate_limiter.acquire(bucket_name("search", tacct), MIN_SEARCH_DELAY, MAX_SEARCH_DELAY)
 			flags = []
 			if user.followers_count < min_followers:
 				flags.append('FLWRS')
@@ -304,7 +305,7 @@ def find_new_friends(screen_name, exisisting_friend_ids, make_changes):
 						if not DRYRUN and make_changes:
 							new_count = len(new_friends) + 1
 							if len(new_friends) > 1:
-								snoozer(MIN_FOLLOW_DELAY, MAX_FOLLOW_DELAY)
+								rate_limiter.acquire(bucket_name("follow", tacct), MIN_FOLLOW_DELAY, MAX_FOLLOW_DELAY)
 							fn_logger.debug("%3d) Now Following @%-16s (%d)" % (new_count, screen_name, user_id))  # ToDo: Add count
 							new_friend = api.create_friendship(user_id=user_id)
 						new_friends.append(screen_name)
@@ -478,7 +479,7 @@ def get_ids(id_type, user_id=None, screen_name=None, max_pages=None):
 			if page_count == max_pages:
 				fn_logger.info("Page limit reached, fetching %s IDs for @%s.  Exiting Cursor loop" % (friendly_id_type, screen_name))
 				break
-			snoozer(44.4444, 77.7777)
+			rate_limiter.acquire(bucket_name("ids", tacct), 44.4444, 77.7777)
 		fn_logger.debug("Fetched %d %s IDs for @%s" % (len(ids), friendly_id_type, screen_name))
 		save_ids(filename, ids)
 	columns = ['user_id', 'friend_id', 'asof',]
@@ -516,7 +517,7 @@ def get_users(user_ids, list_type=None, screen_name=None, return_type=None):
 	fn_logger.debug("Fetching User objects (list_type=%s screen_name=%s return_type=%s) . . ." % (list_type, screen_name, return_type))
 	for batch_count, batch in enumerate(batches):
 		if batch_count > 0:
-			snoozer(MIN_BATCH_DELAY, MAX_BATCH_DELAY)
+			rate_limiter.acquire(bucket_name("batch", tacct), MIN_BATCH_DELAY, MAX_BATCH_DELAY)
 		users = api.lookup_users(user_id=batch, tweet_mode='extended')
 		tweepy_users.extend(users)
 		fn_logger.debug("Fetched %d User objects for batch: %d" % (len(users), batch_count + 1))
@@ -674,7 +675,7 @@ def prune_idlers(screen_name, friend_ids, common_friends, no_img, make_changes):
 			if not DRYRUN and make_changes:
 				fn_logger.debug('Unfollowing @%s)' % user.screen_name)
 				api.destroy_friendship(screen_name=user.screen_name)
-				snoozer(MIN_FOLLOW_DELAY, MAX_FOLLOW_DELAY)
+				rate_limiter.acquire(bucket_name("follow", tacct), MIN_FOLLOW_DELAY, MAX_FOLLOW_DELAY)
 				if pruned_count == prune_limit:
 					fn_logger.info("Prune limit reached.  Exiting loop")
 					break
@@ -950,33 +951,6 @@ def save_ids(filename, ids):
 	return
 
 
-def snoozer(min_sleep, max_sleep=None):
-	"""
-	Sleep for for a specified amount of time; if max_sleep is specified,
-	a random number is generated
-	:param min_sleep: The minimum amount of time to sleep
-	:param max_sleep: The maximum amount of time to sleep, if supplied
-	:return: None
-	"""
-	fn_logger = logging.getLogger("%s.snoozer" % __MODULE__)
-	if type(min_sleep) not in [int, float]:
-		raise ValueError("min_sleep should be an int or float")
-	if max_sleep:
-		if type(max_sleep) not in [int, float]:
-			raise ValueError("max_sleep should be an int or float")
-		sleep_seconds = abs(uniform(min_sleep, max_sleep))
-	else:
-		sleep_seconds = abs(min_sleep)
-	start_ts = datetime.now().timestamp()
-	fn_logger.debug('sleep(%f)' % sleep_seconds)
-	sleep(sleep_seconds)
-	stop_ts = datetime.now().timestamp()
-	actual_sleep = stop_ts - start_ts
-	if actual_sleep < sleep_seconds:
-		raise Exception("actual sleep less than requested sleep")
-	return
-
-
 def stringify(iterable, separator=','):
 	iterable = separator.join([ str(x) for x in iterable ])
 	return iterable
@@ -1049,6 +1023,9 @@ if __name__ == '__main__':
 	MAX_SEARCH_DELAY = Config.MAX_SEARCH_DELAY
 	MIN_SEARCH_DELAY = Config.MIN_SEARCH_DELAY
 
+	# Rate-limit buckets shared with other jobs
+	rate_limiter = RateLimiter()
+
 	NEW_FRIEND_LIMIT = Config.NEW_FRIEND_LIMIT
 	MIN_LISTED_COUNT = Config.MIN_LISTED_COUNT
 	MIN_STATUS_COUNT = Config.MIN_STATUS_COUNT
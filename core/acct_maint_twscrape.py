@@ -2,20 +2,22 @@
 # -*- coding: utf-8 -*-
 # acct_maint_twscrape.py - Thursday, June 22, 2023
 """ Follow retweeters and unfollow less-active tweeps """
-__version__ = "0.2.6-dev49"
+__version__ = "0.2.6-dev91"
 
 import builtins
-import json
 import logging.config
 import lzma
+import multiprocessing
 import os
+import sqlite3
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from itertools import cycle
+from hashlib import md5
 from os.path import basename, exists, getmtime, join
 from pathlib import Path
-from random import shuffle, uniform
-from time import sleep
+from random import shuffle
+from time import monotonic
 
 import click
 import coloredlogs
@@ -24,13 +26,29 @@ import pandas as pd
 import snscrape.base
 import snscrape.modules.twitter as sntwitter
 from pid.decorator import pidfile
-from requests import get
 from sqlalchemy import create_engine, inspect, text
 
 basedir = Path(__file__).resolve().parent.parent
 if basedir not in sys.path:
 	sys.path.insert(0, str(basedir))
+from archive import (
+	ARCHIVE_TYPES,
+	find_archive_member,
+	find_archive_parts,
+	find_archive_zip,
+	iter_archive_items,
+	iter_zip_items,
+	parse_archive_parts,
+	parts_key,
+)
 from config import Config
+from fetch_engine import FetchEngine
+from freshness import FreshnessCache, issue_kind
+from idarray import as_ids, cached_ids, union
+import jsonlib
+from proxypool import ProxyPool, proxies_from_env
+from ratelimit import RateLimiter
+from userstate import UserStates
 
 __module__ = Path(__file__).resolve().stem
 
@@ -39,122 +57,73 @@ PIDDIR = "/run/user/%d" % os.getegid()
 if not exists(PIDDIR):
 	PIDDIR = "/tmp"
 
-
+# COPY ... FROM STDIN
+COPY_CHUNK_SIZE = 1024 * 1024  # bytes per write
+COPY_JSON_OPTIONS = "CSV QUOTE e'\x01' DELIMITER e'\x02'"
+
+# Relationship files are loaded, and then merged, this many lines / User IDs at a time
+RELATION_CHUNK_LINES = 50_000
+# dt_relation column set by each fn_relation operation
+RELATION_COLUMNS = {"follow": "follows", "block": "blocks", "mute": "mutes"}
+
+# File Status: new status -> statuses it may follow (R=Ready, J=JSON loaded,
+# P=Posted, C=Complete, S=Skipped).  Resuming a batch restarts a file from R, and
+# the upserts are idempotent, so a file left at R or J is simply loaded again.
+FILE_STATUS_TRANSITIONS = {
+	"R": (None, "R", "J", "P"),
+	"J": ("R",),
+	"P": ("J",),
+	"C": ("P",),
+	"S": (None, "R"),
+}
+
+
+@click.command()
+@click.option(
+	"-j", "--jobs", default=1, show_default=True, help="Accounts to process in parallel"
+)
+@click.option(
+	"-r", "--resume", is_flag=True, help="Resume the last incomplete batch"
+)
 @pidfile(piddir=PIDDIR)
-def main():
+def main(jobs, resume):
 	acct_names = Config.ACCTS
-	batch_id = get_new_batch_id(_run_dt)
-	for acct_name in acct_names:
-		acct_dict = process_acct_info(batch_id, acct_name)
-		acct_id = acct_dict["id"]
-		user_dict = process_user_info(acct_name, acct_id)
-		last_tweet = None
-		last_tweet_date = None 
-		if "lastTweet" in user_dict:
-			last_tweet = user_dict["lastTweet"]
-		if "lastTweetDate" in user_dict:
-			last_tweet_date = user_dict["lastTweetDate"]
-		rows = process_following(batch_id, acct_name, acct_id)
-			
-	return
-
-
-# @click.command()
-# @click.argument("twit", nargs=-1)
-# @pidfile(piddir=PIDDIR)
-def main_old():
-	twit_list = Config.ACCTS
-	twit = tuple(twit_list)
-	for screen_name in twit:
-		screen_name = screen_name.lstrip("@")
-
-		# Load from Twitter data dump
-		acct_dict = load_account_info(screen_name)
-		acct_id = acct_dict["accountId"]
-		asof = acct_dict["asof"]
-		following_ids = load_friend_ids(screen_name=screen_name)
-		logger.info(f"Following IDs: {len(following_ids):,d}")
-		follower_ids = load_follower_ids(screen_name=screen_name)
-		logger.info(f"Follower IDs : {len(follower_ids):,d}")
-
-		cached_follower_ids = get_cached_user_ids(follower_ids)
-		cached_following_ids = get_cached_user_ids(following_ids)
-
-		# Update friends / following (Cached)
-		if cached_following_ids:
-			update_relations(acct_id, asof, "following", cached_following_ids)
-
-		# Update followers (Cached)
-		if cached_follower_ids:
-			update_relations(acct_id, asof, "follower", cached_follower_ids)
-
-		# Find User IDs with issues
-		bad_follower_ids = get_bad_user_ids(follower_ids)
-		bad_following_ids = get_bad_user_ids(following_ids)
-
-		# Determine which User IDs to fetch (ie. not cached or current)
-		fetch_follower_ids = sorted(
-			list(set(follower_ids) - set(cached_follower_ids) - set(bad_follower_ids))
-		)
-		fetch_following_ids = sorted(
-			list(
-				set(following_ids) - set(cached_following_ids) - set(bad_following_ids)
-			)
-		)
-		# Eliminate duplicates
-		fetch_user_ids = sorted(list(set(fetch_following_ids + fetch_follower_ids)))
-		logger.info(f"User IDs to fetch: {len(fetch_user_ids):,d}")
-
-		if fetch_user_ids:
-			# Testing
-			if _test_max_users:
-				# Shuffle list of IDs to fetch and pick first XXX values
-				for _ in range(10):
-					shuffle(fetch_user_ids)
-				fetch_user_ids = fetch_user_ids[:_test_max_users]
-				# Reduce following/follower IDs to those in the list, above
-				following_ids = list(
-					set(following_ids).intersection(set(fetch_user_ids))
-				)
-				follower_ids = list(set(follower_ids).intersection(set(fetch_user_ids)))
-				logger.info(f"[TEST] User IDs to fetch: {len(fetch_user_ids)}")
-				for i, fetch_user_id in enumerate(fetch_user_ids):
-					logger.info(f"    {i + 1:4d} {fetch_user_id}")
-			# Fetch profiles for User IDs
-			line_number = 0
-			all_fetched_ids = []
-			batch_size = Config.BATCH_SIZE
-			batches = (
-				fetch_user_ids[i : i + batch_size]
-				for i in range(0, len(fetch_user_ids), batch_size)
-			)
-			for batch_count, batch in enumerate(batches):
-				if batch_count > 0:
-					snoozer(_min_batch_delay, _max_batch_delay)
-				fetched_ids = fetch_users(batch, line_number)
-				if fetched_ids:
-					fetched_follower_ids = sorted(
-						list(set(follower_ids).intersection(set(fetched_ids)))
-					)
-					fetched_following_ids = sorted(
-						list(set(following_ids).intersection(set(fetched_ids)))
-					)
-
-					# Update friends / following (Fetched)
-					if fetched_following_ids:
-						update_relations(
-							acct_id, asof, "following", fetched_following_ids
-						)
-
-					# Update followers (Fetched)
-					if fetched_follower_ids:
-						update_relations(
-							acct_id, asof, "follower", fetched_follower_ids
-						)
-
-					# ToDo: blocked & muted
-					line_number += batch_size
-					do_nothing()
+	batch_id = None
+	if resume:
+		batch_id = get_resume_batch_id()
+		if batch_id:
+			logger.info(f"Resuming Batch ID {batch_id}")
+		else:
+			logger.info("No incomplete batches to resume")
+	if not batch_id:
+		batch_id = get_new_batch_id(_run_dt)
+	# Profiles first, so relations can refer to them
+	process_users(batch_id)
+	summaries = []
+	if jobs > 1 and len(acct_names) > 1:
+		# Forked workers inherit the configuration; each gets its own connection pool
+		with ProcessPoolExecutor(
+			max_workers=min(jobs, len(acct_names)),
+			mp_context=multiprocessing.get_context("fork"),
+			initializer=init_worker,
+		) as executor:
+			futures = {
+				executor.submit(process_account, batch_id, acct_name): acct_name
+				for acct_name in acct_names
+			}
+			for future in as_completed(futures):
+				acct_name = futures[future]
+				try:
+					summaries.append(future.result())
+				except Exception as e:
+					logger.exception(f"@{acct_name}: {e}")
+					summaries.append({"acct_name": acct_name, "error": str(e)})
+	else:
+		for acct_name in acct_names:
+			summaries.append(process_account(batch_id, acct_name))
+	log_summary(batch_id, summaries)
+	complete_batch(batch_id)
+	user_states.schedule_refreshes()
 	return
 
 
@@ -169,26 +138,20 @@ def init():
 	logger.info(" ".join(msgs))
 	# get_table_names()
 	if ONLINE_MODE:
-		proxy = os.getenv("ALL_PROXY")
-		if proxy:
-			print(f"ALL_PROXY = {proxy}")
-		# Check IP Address being used
-		check_ip_pool = cycle(Config.MYIP_URLS_HTTPS)
-		retries = 3
-		while retries > 0:
-			try:
-				url = next(check_ip_pool)
-				r = get(url, timeout=(3.05, 30))
-				if r.ok:
-					logger.info(f"IP Address: {r.text.rstrip()} via {url}")
-				retries = -1
-			except Exception as e:
-				retries -= 1
-				if retries > 0:
-					logger.warning(e)
-				else:
-					logger.exception(e)
-				do_nothing()
+		# Check the IP Address each proxy egresses from, all at once
+		for label, stats in proxy_pool.check().items():
+			if stats.ejected_at is None:
+				logger.info(f"IP Address: {stats.ip} via {label} ({stats.latency:.2f}s)")
+			else:
+				logger.warning(f"Proxy {label} ejected: {stats.last_error}")
+	return
+
+
+def init_worker():
+	"""
+	Runs in each worker process, so it doesn't share the parent's database connections
+	"""
+	engine.dispose(close=False)
 	return
 
 
@@ -199,97 +162,242 @@ def eoj():
 	return
 
 
-def db_create_view(tablename: str, row_type: str) -> str | None:
+def archive_source(screen_name: str) -> tuple:
+	"""
+	:return: (archive zip or extracted data directory, directory for ID sidecars),
+		or (None, None) if the account has no archive
+	"""
+	cache_dir = _twscrape_data_dir / f"{screen_name}"
+	zip_path = find_archive_zip(_twscrape_data_dir, screen_name)
+	if zip_path:
+		cache_dir.mkdir(parents=True, exist_ok=True)
+		return zip_path, cache_dir
+	data_dir = cache_dir / "data"
+	if exists(data_dir):
+		return data_dir, data_dir
+	return None, None
+
+
+def complete_batch(batch_id: int) -> bool:
+	"""
+	Marks a batch complete once none of its files have work left to do
+	"""
+	sql = """
+		UPDATE dt_batch_control AS bc
+		SET batch_status = 'C', completion_date = now()
+		WHERE bc.id = :batch_id
+		  AND bc.completion_date IS NULL
+		  AND NOT EXISTS (
+			SELECT 1 FROM dt_file_control fc
+			WHERE fc.batch_id = bc.id
+			  AND COALESCE(fc.file_status, 'R') NOT IN ('C', 'S')
+		  );
+	""".strip()
+	with engine.begin() as trans:
+		completed = trans.execute(text(sql), {"batch_id": batch_id}).rowcount > 0
+	if not completed:
+		logger.warning(f"Batch ID {batch_id} is incomplete; rerun with --resume")
+	return completed
+
+
+def db_create_view(tablename: str, row_type: str, viewname: str = None) -> str | None:
+	"""
+	:param viewname: defaults to tmp_{row_type}
+	"""
 	sql = None
 	row_type = row_type.lower()
+	if viewname is None:
+		viewname = f"tmp_{row_type}"
 	if row_type not in ["following", "followers", "accountinfo", "user", "usertweet"]:
 		raise ValueError(f"Unrecognized file_type: '{row_type}'")
-	if row_type == "following":
+	if row_type in ["following", "followers"]:
 		sql = f"""
-			CREATE TEMP VIEW tmp_following AS
-			SELECT j->'id_str' id_str, j->'username' username
+			CREATE TEMP VIEW {viewname} AS
+			SELECT	COALESCE(j->>'id_str', j->>'id')::BIGINT user_id,
+				j->>'username' username,
+				j->>'displayname' displayname,
+				(j->>'created')::TIMESTAMPTZ created_at,
+				(j->>'followersCount')::BIGINT followers_count,
+				(j->>'friendsCount')::BIGINT friends_count,
+				(j->>'listedCount')::BIGINT listed_count,
+				(j->>'mediaCount')::BIGINT media_count,
+				(j->>'statusesCount')::BIGINT statuses_count
 			FROM {tablename};
 		"""
 	elif row_type == "usertweet":
+		# Expects {tablename} to have asof & j columns (see process_users)
 		# jsonb_array_elements(j->'descriptionLinks')->'url'
 		usertweet_cols = {
-			"_type": "_type",
-			"blue": "blue",
-			"blueType": "blue_type",
-			"created": "created_at",
-			"descriptionLinks": "description_links",
-			"displayname": "display_name",
-			"favouritesCount": "favourites_count",
-			"followersCount": "followers_count",
-			"friendsCount": "friends_count",
-			"id": "id",
-			"id_str": "id_str",
-			"lastTweet": "last_tweet",
-			"lastTweetDate": "last_tweet_date",
-			"listedCount": "listed_count",
-			"location": "location",
-			"mediaCount": "media_count",
-			"profileBannerUrl": "banner_url",
-			"profileImageUrl": "image_url",
-			"protected": "protected",
-			"rawDescription": "description",
-			"statusesCount": "statuses_count",
-			"url": "url",
-			"username": "username",
+			"_type": ("_type", "TEXT"),
+			"blue": ("blue", "BOOLEAN"),
+			"blueType": ("blue_type", "TEXT"),
+			"created": ("created_at", "TIMESTAMPTZ"),
+			"descriptionLinks": ("description_links", "JSONB"),
+			"displayname": ("displayname", "TEXT"),
+			"favouritesCount": ("favourites_count", "BIGINT"),
+			"followersCount": ("followers_count", "BIGINT"),
+			"friendsCount": ("friends_count", "BIGINT"),
+			"lastTweet": ("last_tweet", "JSONB"),
+			"lastTweetDate": ("last_tweeted", "TIMESTAMPTZ"),
+			"listedCount": ("listed_count", "BIGINT"),
+			"location": ("location", "TEXT"),
+			"mediaCount": ("media_count", "BIGINT"),
+			"profileBannerUrl": ("banner_url", "TEXT"),
+			"profileImageUrl": ("image_url", "TEXT"),
+			"protected": ("protected", "BOOLEAN"),
+			"rawDescription": ("description", "TEXT"),
+			"statusesCount": ("statuses_count", "BIGINT"),
+			"url": ("url", "TEXT"),
+			"username": ("username", "TEXT"),
+			"verified": ("verified", "BOOLEAN"),
 		}
-		sql = """ CREATE TEMP VIEW loaded_json AS
-			SELECT id, batch_id, file_id, asof, posted_at, data_type, acct_name, acct_id, md5_hash,
-				j->>'id_str' id_str,
-				j->>'username' username,
-				j->>'displayname' displayname,
-				j->>'created' created,
-				j->>'statusesCount' statusesCount,
-				j->>'friendsCount' friendsCount,
-				j->>'followersCount' followersCount,
-				j->>'favouritesCount' favouritesCount,
-				j->>'listedCount' listedCount,
-				j->>'mediaCount' mediaCount,
-				j->>'protected' protected,
-				j->>'verified' verified,
-				j->>'blue' blue,
-				j->>'blueType' blueType,
-				j->>'profileImageUrl' profileImageUrl,
-				j->>'profileBannerUrl' profileBannerUrl,
-				j->>'location' location,
-				j->>'rawDescription' rawDescription
-			FROM dt_json_loader;
+		cols = []
+		for key, (colname, coltype) in usertweet_cols.items():
+			if coltype == "JSONB":
+				cols.append(f"j->'{key}' {colname}")
+			elif coltype == "TEXT":
+				cols.append(f"j->>'{key}' {colname}")
+			else:
+				cols.append(f"(j->>'{key}')::{coltype} {colname}")
+		select_list = ",\n\t\t\t\t".join(cols)
+		sql = f"""
+			CREATE TEMP VIEW {viewname} AS
+			SELECT	COALESCE(j->>'id_str', j->>'id')::BIGINT user_id,
+				asof,
+				{select_list}
+			FROM {tablename};
 		"""
 	return sql.strip()
 
 
-def db_load_json(batch_id: int, file_type: str, filename: str | Path) -> list:
-	loaded_rows = []
-	file_type = file_type.lower()
-	if file_type not in ["following", "followers", "accountinfo", "user", "usertweet"]:
-		raise ValueError(f"Unrecognized file_type: '{file_type}'")
-	file_dict = get_new_file_id(batch_id, filename)
-	if file_dict:
-		file_id = file_dict["file_id"]
-		tbl = f"tmp_json_{batch_id}_{file_id}"
-
-		stmts = [
-			f"CREATE TEMP TABLE {tbl} (j JSONB) ON COMMIT DROP;",
-			f"COPY {tbl} FROM '{filename}' CSV QUOTE e'\x01' DELIMITER e'\x02';",
-			db_create_view(tbl, file_type),
-			f"SELECT * FROM tmp_{file_type} LIMIT 10;"
-		]
-		with engine.begin() as trans:
-			for stmt in stmts:
-				result = trans.execute(text(stmt))
-				if result.rowcount > 0:
-					loaded_rows = result.fetchall()
-					do_nothing()
-		if loaded_rows:
-			update_file_status(file_id, "J")
-	return loaded_rows
+def db_copy_chunk(conn, tablename: str, lines: list) -> int:
+	"""
+	Copies a chunk of JSON lines (bytes) into a single-column (JSONB) table
+	:return: number of bytes copied
+	"""
+	data = b"".join(lines)
+	dbapi_conn = conn.connection.driver_connection
+	with dbapi_conn.cursor() as cur:
+		with cur.copy(f"COPY {tablename} FROM STDIN {COPY_JSON_OPTIONS};") as copy:
+			copy.write(data)
+	return len(data)
+
+
+def db_insert_stub_users(conn, view: str, asof: datetime) -> int:
+	"""
+	Adds dt_user rows for users in a loaded twscrape view that aren't in the database, yet,
+	so dt_relation's foreign keys are satisfied; existing users are left alone
+	"""
+	sql = f"""
+		INSERT INTO dt_user (
+			user_id, asof, username, displayname, created_at,
+			followers_count, friends_count, listed_count, media_count, statuses_count
+		)
+		SELECT DISTINCT ON (user_id)
+			user_id, :asof, username, displayname, created_at,
+			followers_count, friends_count, listed_count, media_count, statuses_count
+		FROM	{view}
+		WHERE	user_id IS NOT NULL
+		ORDER BY user_id
+		ON CONFLICT (user_id) DO NOTHING;
+	""".strip()
+	return conn.execute(text(sql), {"asof": asof}).rowcount
+
+
+def db_merge_relations(
+	conn,
+	ids_tbl: str,
+	operation: str,
+	acct_id: int,
+	asof: datetime,
+	incoming: bool = False,
+	after: int = 0,
+	limit: int = RELATION_CHUNK_LINES,
+) -> tuple:
+	"""
+	Merges the next `limit` User IDs above `after` from a file's ID table into
+	dt_relation with one fn_relation_bulk() call.  The table is de-duplicated, so
+	each User ID is merged, and counted, once per file
+	:return: (counts of relations inserted, updated and unchanged, last User ID
+		merged or None when there are none left)
+	"""
+	params = {
+		"operation": operation,
+		"acct_id": acct_id,
+		"asof": asof,
+		"incoming": incoming,
+		"after": after,
+		"limit": limit,
+	}
+	sql = f"""
+		WITH batch AS (
+			SELECT	user_id FROM {ids_tbl}
+			WHERE	user_id > :after
+			ORDER BY user_id
+			LIMIT	:limit
+		)
+		SELECT	b.inserted, b.updated, b.unchanged,
+			(SELECT MAX(user_id) FROM batch)
+		FROM	fn_relation_bulk(
+			:operation, :acct_id, ARRAY(SELECT user_id FROM batch), :asof, :incoming
+		) b;
+	""".strip()
+	inserted, updated, unchanged, last_id = conn.execute(text(sql), params).fetchone()
+	return {"inserted": inserted, "updated": updated, "unchanged": unchanged}, last_id
+
+
+def db_prune_relations(
+	conn, ids_tbl: str, operation: str, acct_id: int, asof: datetime, incoming: bool = False
+) -> int:
+	"""
+	Ends relations of acct_id whose other user isn't in a file's ID table, as
+	fn_relation_prune() does, but joined against the table itself rather than an
+	array of every User ID in the file.  An empty table is treated as missing data
+	"""
+	colname = RELATION_COLUMNS[operation]
+	acct_col, user_col = ("user_id2", "user_id1") if incoming else ("user_id1", "user_id2")
+	params = {"acct_id": acct_id, "asof": asof}
+	sql = f"""
+		UPDATE dt_relation AS dr
+		SET	{colname} = false, asof = :asof
+		WHERE	dr.{acct_col} = :acct_id
+		  AND	dr.{colname}
+		  AND	EXISTS (SELECT 1 FROM {ids_tbl})
+		  AND	NOT EXISTS (
+			SELECT 1 FROM {ids_tbl} t WHERE t.user_id = dr.{user_col}
+		  );
+	""".strip()
+	return conn.execute(text(sql), params).rowcount
+
+
+def fetch_user(user_id: int, proxies: dict = None) -> tuple:
+	"""
+	Blocking snscrape lookup, run on a FetchEngine worker thread
+	:param proxies: from the proxy pool; None goes direct (or via ALL_PROXY)
+	:return: (entity, last_tweeted, url)
+	"""
+	user = sntwitter.TwitterUserScraper(user_id, proxies=proxies)
+	entity = user.entity
+
+	if entity.link:
+		url = entity.link.url
+	else:
+		url = None
+	last_tweeted = None
+	i, tweet = -1, None
+	for i, tweet in enumerate(user.get_items()):
+		last_tweeted = tweet.date
+		if i == 1:
+			break
+	return entity, last_tweeted, url
 
 
-def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
+def fetch_users(user_ids: list | set, lineno: int = 0, concurrency: int = 1) -> list:
+	"""
+	Fetches profiles on `concurrency` workers per healthy proxy, each proxy spaced by
+	the search delay range in its own rate bucket, and records each one with
+	insert_user() / insert_issue() as it completes
+	"""
 	fetched_ids = []
 	no_tweet_ids = []
 	error_ids = []
@@ -308,24 +416,11 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 	for _ in range(10):
 		shuffle(user_ids)
 
-	# Fetch User IDs
-	for count, user_id in enumerate(user_ids):
-		if count > 0:
-			sleep(uniform(_min_search_delay, _max_search_delay))
-		try:
-			user = sntwitter.TwitterUserScraper(user_id)
-			entity = user.entity
-
-			if entity.link:
-				url = entity.link.url
-			else:
-				url = None
-			last_tweeted = None
-			i, tweet = -1, None
-			for i, tweet in enumerate(user.get_items()):
-				last_tweeted = tweet.date
-				if i == 1:
-					break
+	def record_result(result):
+		nonlocal consecutive_error_count
+		count, user_id = result.index, result.user_id
+		if result.error is None:
+			entity, last_tweeted, url = result.value
 			if not last_tweeted:
 				# Protected or shadow-banned account?
 				no_tweet_ids.append(user_id)
@@ -339,7 +434,7 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 				logger.warning(msg)
 				insert_issue(user_id, _run_dt, False, True, False, msg)
 			logger.debug(f"{lineno+count+1:5d}) {user_id:19d} Adding to database . . .")
-			good_id = insert_user(
+			insert_user(
 				user_id=int(entity.id),
 				asof=_run_dt,  # AsOf
 				username=entity.username,
@@ -361,10 +456,12 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 				image_url=entity.profileImageUrl,
 				banner_url=entity.profileBannerUrl,
 			)
-			fetched_ids.append(good_id)
+			# insert_user() returns None for an unchanged profile, which was still fetched
+			fetched_ids.append(user_id)
 			consecutive_error_count = 0
 			do_nothing()
-		except snscrape.base.ScraperException as e:
+		elif isinstance(result.error, snscrape.base.ScraperException):
+			e = result.error
 			consecutive_error_count += 1
 			error_ids.append(user_id)
 			msg = " ".join(
@@ -384,10 +481,52 @@ def fetch_users(user_ids: list | set, lineno: int = 0) -> list:
 				insert_issue(user_id, _run_dt, False, False, False, msg)
 			if consecutive_error_count == 25:
 				raise Exception("Too many errors.  Aborting.")
-		# snoozer(_min_error_delay, _max_error_delay)
+		else:
+			raise result.error
+		return
+
+	# Fetch User IDs
+	proxies = proxy_pool.healthy()
+	if not proxies:
+		# Every proxy was ejected; readmit any that have recovered
+		proxy_pool.check()
+		proxies = proxy_pool.healthy()
+		if not proxies:
+			raise Exception("No healthy proxies.  Aborting.")
+	fetch_engine = FetchEngine(
+		proxy_pool.wrap(fetch_user, is_proxy_error=is_proxy_error),
+		concurrency=concurrency * len(proxies),
+		delay_range=(_min_search_delay, _max_search_delay),
+		identities=proxies,
+		endpoint="user",
+		limiter=rate_limiter,
+		health=proxy_pool.is_healthy,
+		error_delay_range=(_min_error_delay, _max_error_delay),
+	)
+	fetch_engine.run_sync(user_ids, on_result=record_result)
 	return fetched_ids
 
 
+def file_stats(filename: str | Path) -> dict:
+	"""
+	Counts lines and bytes and computes the MD5 digest of a file in a single pass
+	"""
+	lines = 0
+	file_size = 0
+	last_byte = b"\n"
+	digest = md5()
+	with open(filename, "rb") as fp:
+		while chunk := fp.read(COPY_CHUNK_SIZE):
+			digest.update(chunk)
+			lines += chunk.count(b"\n")
+			file_size += len(chunk)
+			last_byte = chunk[-1:]
+	if last_byte != b"\n":
+		# Last line has no line ending
+		lines += 1
+	return {"lines": lines, "file_size": file_size, "digest": digest.hexdigest()}
+
+
 def find_logging_config() -> str | None:
 	logging_config = None
 	config_dirs = ["/etc/Searches", basedir]  # ToDo: configdir
@@ -399,102 +538,6 @@ def find_logging_config() -> str | None:
 	return logging_config
 
 
-def get_cached_users(user_ids):
-	user_ids = sorted(user_ids)
-	tablename = "dt_user"
-	columns = [
-		"user_id",
-		"asof",
-		"username",
-		"displayname",
-		"created_at",
-		"followers_count",
-		"friends_count",
-		"listed_count",
-		"statuses_count",
-		"last_tweeted",
-	]
-	where_clause = "asof > :since"
-	order_by = "asof DESC"
-	params = {"since": (_run_dt.replace(microsecond=0) - timedelta(days=_cache_days))}
-	sql = f"SELECT * FROM {tablename} WHERE {where_clause} ORDER BY {order_by};"
-	with engine.connect() as conn:
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-
-		where_conditions = [
-			"user_id IN (%s)" % stringify(user_ids),
-			"asof > '%s'" % (_run_dt.replace(microsecond=0) - timedelta(hours=24)),
-		]
-		where_clause = " AND ".join(where_conditions)
-		orderby_clause = "user_id"
-
-		sql = "SELECT DISTINCT * FROM %s WHERE %s ORDER BY %s LIMIT 100000;" % (
-			tablename,
-			where_clause,
-			orderby_clause,
-		)
-		print(sql)
-		rows = conn.execute(text(sql))
-		row_count = rows.rowcount
-		print("Row Count: {:,d}".format(row_count))
-		# df = pd.DataFrame(rows, columns=rows.keys())
-	return pd.DataFrame(rows, columns=list(rows.keys()))
-
-
-# ToDo: Should this be using dt_user_history?
-def get_cached_user_ids(user_ids):
-	user_ids = sorted(user_ids)
-	cached_user_ids = []
-	with engine.connect() as conn:
-		tablename = "dt_user"
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-		params = {
-			"since": (_run_dt.replace(microsecond=0) - timedelta(days=_cache_days))
-		}
-		# Columns: ['user_id', 'asof', 'screen_name', 'name', 'created_at', 'default_profile_image', 'protected', 'followers_count', 'friends_count', 'listed_count', 'statuses_count', 'last_tweet']
-		where_conditions = [
-			"user_id IN (%s)" % stringify(user_ids),
-			"asof > :since",
-		]
-		where_clause = " AND ".join(where_conditions)
-		orderby_clause = "user_id"
-		sql = f"SELECT DISTINCT user_id FROM {tablename} WHERE {where_clause} ORDER BY {orderby_clause};"
-		# logger.info(sql)
-		for row in conn.execute(text(sql), params).fetchall():
-			cached_user_ids.append(row[0])
-		row_count = len(cached_user_ids)
-		# df = pd.DataFrame(rows, columns=rows.keys())
-	return cached_user_ids
-
-
-def get_bad_user_ids(user_ids):
-	user_ids = sorted(user_ids)
-	bad_user_ids = []
-
-	with engine.connect() as conn:
-		tablename = "dt_issue"
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-		params = {
-			"since": (_run_dt.replace(microsecond=0) - timedelta(days=_cache_days))
-		}
-		# Columns: ['user_id', 'asof', 'screen_name', 'name', 'created_at', 'default_profile_image', 'protected', 'followers_count', 'friends_count', 'listed_count', 'statuses_count', 'last_tweet']
-		where_conditions = [
-			"user_id IN (%s)" % stringify(user_ids),
-			"asof > :since",
-		]
-		where_clause = " AND ".join(where_conditions)
-		orderby_clause = "user_id"
-		sql = f"SELECT DISTINCT user_id FROM {tablename} WHERE {where_clause} ORDER BY {orderby_clause};"
-		# logger.info(sql)
-		for row in conn.execute(text(sql), params).fetchall():
-			bad_user_ids.append(row[0])
-		row_count = len(bad_user_ids)
-	return bad_user_ids
-
-
 def get_follower_ids(user_id=None, screen_name=None):
 	return load_ids(id_type="follower", user_id=user_id, screen_name=screen_name)
 
@@ -513,25 +556,41 @@ def get_new_batch_id(batch_date: datetime | None) -> int:
 
 
 def get_new_file_id(batch_id: int, filename: str | Path) -> dict | None:
+	"""
+	Registers a file in dt_file_control with status 'R'.  If the same file (by path,
+	so another account's identical file doesn't count) has already been posted with
+	the same contents, the new entry is marked as skipped ('S').
+	When resuming, the file's existing entry is returned instead.  file_dict["skip"]
+	is True when there is nothing left to do for the file.
+	"""
 	file_dict = None
 	filedate = datetime.fromtimestamp(getmtime(filename)).astimezone()
-	lines = line_count(filename)
+	stats = file_stats(filename)
 
 	with engine.begin() as trans:
+		sql = """
+			SELECT id FROM dt_file_control
+			WHERE filename = :filename
+			  AND digest = :digest
+			  AND file_size = :file_size
+			  AND file_status IN ('P', 'C')
+			ORDER BY id DESC
+			LIMIT 1;
+		""".strip()
+		row = trans.execute(text(sql), {**stats, "filename": str(filename)}).fetchone()
+		skipped_for = row[0] if row else None
 		params = {
 			"batch_id": batch_id,
 			"filename": str(filename),
 			"filedate": filedate,
-			"lines": lines,
+			"lines": stats["lines"],
+			"file_size": stats["file_size"],
+			"digest": stats["digest"],
+			"file_status": "S" if skipped_for else "R",
+			"skipped_for": skipped_for,
 		}
-		columns = [
-			"batch_id",
-			"filename",
-			"filedate",
-			"lines",
-		]
-		cols = ",".join(columns)
-		placeholders = ",".join(f":{x}" for x in columns)
+		cols = ",".join(params.keys())
+		placeholders = ",".join(f":{x}" for x in params.keys())
 		sql = f"""
 			INSERT INTO dt_file_control({cols})
 			VALUES({placeholders})
@@ -542,13 +601,45 @@ def get_new_file_id(batch_id: int, filename: str | Path) -> dict | None:
 			result = trans.execute(text(sql), params)
 			if result.rowcount > 0:
 				file_id = result.fetchone()[0]
-				file_dict = {"file_id": file_id, "filedate": filedate, "lines": lines}
+				file_dict = {
+					"file_id": file_id,
+					"filedate": filedate,
+					"lines": stats["lines"],
+					"file_status": params["file_status"],
+				}
+				if skipped_for:
+					logger.debug(
+						f"Unchanged since File ID {skipped_for}, skipping {filename}"
+					)
+			else:
+				# Already registered in this batch (ie. resuming)
+				sql = """
+					SELECT id, filedate, lines, file_status FROM dt_file_control
+					WHERE batch_id = :batch_id AND filename = :filename;
+				""".strip()
+				row = trans.execute(text(sql), params).fetchone()
+				file_dict = {
+					"file_id": row[0],
+					"filedate": row[1],
+					"lines": row[2],
+					"file_status": row[3],
+				}
 		except Exception as e:
 			logger.exception(e)
 			do_nothing()
+	if file_dict:
+		# Nothing left to do for skipped or completed files
+		file_dict["skip"] = file_dict["file_status"] in ("C", "S")
 	return file_dict
 
 
+def get_resume_batch_id() -> int | None:
+	sql = "SELECT batch_id FROM incomplete_batches ORDER BY batch_id DESC LIMIT 1;"
+	with engine.connect() as conn:
+		row = conn.execute(text(sql)).fetchone()
+	return row[0] if row else None
+
+
 def get_table_names():
 	# Get Table Names
 	logger.debug("Table Names & Row Counts:")
@@ -566,11 +657,15 @@ def load_account_info(screen_name: str) -> dict:
 	- Uses timestamp of the archive to obtain 'asof' date
 	"""
 	acct_dict = {}
-	filename = _twscrape_data_dir / f"{screen_name}" / "data" / f"account.js"
-	asof = datetime.fromtimestamp(getmtime(filename)).astimezone()
-	with open(filename) as fp:
-		data = fp.read().lstrip("window.YTD.account.part0 = ")
-		acct_dict = json.loads(data)[0]["account"]
+	zip_path = find_archive_zip(_twscrape_data_dir, screen_name)
+	if zip_path:
+		member = find_archive_member(zip_path, "account.js")
+		asof = datetime.fromtimestamp(getmtime(zip_path)).astimezone()
+		acct_dict = next(iter_zip_items(zip_path, member))["account"]
+	else:
+		filename = _twscrape_data_dir / f"{screen_name}" / "data" / f"account.js"
+		asof = datetime.fromtimestamp(getmtime(filename)).astimezone()
+		acct_dict = next(iter_archive_items(filename))["account"]
 	acct_dict.update({"asof": asof})
 	return acct_dict
 
@@ -597,16 +692,18 @@ def load_ids(id_type, user_id=None, screen_name=None):
 		)
 	if id_type == "friend":
 		id_type = "following"
+	basename, item_key = ARCHIVE_TYPES[id_type]
 	# filename = _data_dir / f"{screen_name}_following.js"
-	filename = _twscrape_data_dir / f"{screen_name}" / "data" / f"{id_type}.js"
+	filename = _twscrape_data_dir / f"{screen_name}" / "data" / f"{basename}.js"
 	friendly_id_type = str(id_type).capitalize()
 	# fn_logger = logging.getLogger("%s.get_%s_ids" % (__module__, id_type))
 	logger.info(f"Filename: {filename}")
 	ids = []
 	id_key = "accountId"
-	if exists(filename):  # and _run_dt.timestamp() - getmtime(filename) < 12 * 60**2:
-		ids = load_ids_file(id_type, id_key, filename)
-	if not ids:
+	source, cache_dir = archive_source(screen_name)
+	if source:
+		ids = load_ids_file(basename, item_key, id_key, source, cache_dir)
+	if not len(ids):
 		logger.debug("Fetching %s IDs for @%s . . ." % (friendly_id_type, screen_name))
 	return ids
 
@@ -619,6 +716,30 @@ def load_ignored_user_ids():
 	return ids
 
 
+def log_summary(batch_id: int, summaries: list):
+	logger.info(f"Batch {batch_id} Summary:")
+	for summary in sorted(summaries, key=lambda x: x["acct_name"].lower()):
+		acct_name = summary["acct_name"]
+		if "error" in summary:
+			logger.error(f"- @{acct_name:16s} FAILED: {summary['error']}")
+			continue
+		msgs = [f"- @{acct_name:16s}", f"{summary['seconds']:8.1f}s"]
+		for relation_type in ["following", "followers"]:
+			counts = summary[relation_type] or {}
+			msgs.append(
+				", ".join(
+					[
+						f"{relation_type.capitalize()}: {counts.get('inserted', 0):,d} inserted",
+						f"{counts.get('updated', 0):,d} updated",
+						f"{counts.get('unchanged', 0):,d} unchanged",
+						f"{counts.get('pruned', 0):,d} pruned",
+					]
+				)
+			)
+		logger.info(" ".join(msgs))
+	return
+
+
 def idle(last_tweeted):
 	"""
 	Calculate idle time for a user account
@@ -653,6 +774,10 @@ def insert_issue(
 		conn.execute(text(setschema))
 		seen_id = conn.execute(text(sql), params_dict).fetchone()[0]
 		do_nothing()
+	try:
+		freshness.record_issue(user_id, asof, issue_kind(no_response, no_tweets, no_user))
+	except sqlite3.Error as e:
+		logger.warning(f"Freshness cache not updated for {user_id}: {e}")
 
 	return seen_id
 
@@ -710,39 +835,75 @@ def insert_user(
 		setschema = f"SET search_path TO {schema},public;"
 		conn.execute(text(setschema))
 		seen_id = conn.execute(text(sql), params_dict).fetchone()[0]
+		if not seen_id:
+			# Unchanged profile: dt_user isn't written, but the fetch still counts
+			sql = "SELECT fn_user_fetched(:in_user_id, :asof);"
+			conn.execute(text(sql), params_dict)
 		do_nothing()
+	try:
+		freshness.record_user(user_id, asof)
+	except sqlite3.Error as e:
+		logger.warning(f"Freshness cache not updated for {user_id}: {e}")
 	return seen_id
 
 
-def line_count(filename: str | Path) -> int:
-	l = -1
-	with open(filename) as fp:
-		l = sum(1 for _ in fp)
-	return l
+def is_proxy_error(e: Exception) -> bool:
+	"""
+	A missing or suspended user is the answer, not a failure of the proxy it came through
+	"""
+	if isinstance(e, snscrape.base.ScraperException) and "User" in e.args:
+		return False
+	return True
 
 
-def load_ids_file(id_type, id_key, filename):
-	ids = []
-	with open(filename) as fp:
-		# data = json.load(infile)
-		data = fp.read().lstrip(f"window.YTD.{id_type}.part0 = ")
-		ids_dict = json.loads(data)
-
-	do_nothing()
-	for item in ids_dict:
-		if id_type in item:
-			if id_key in item[id_type]:
-				acct_id = item[id_type][id_key]
-				try:
-					acct_id = int(acct_id)
-				except Exception as e:
-					logger.exception(e)
-				# logger.info(acct_id)
-				ids.append(acct_id)
-				do_nothing()
+def load_ids_file(basename, item_key, id_key, source, cache_dir):
+	"""
+	Parses every part of data/{basename}.js (part0, -part1, ...) from the archive zip or
+	extracted data directory, one worker process per part, and merges them.
+	The result is kept in a sidecar under cache_dir, keyed by all the parts' CRCs (zip)
+	or mtimes (files) and sizes; later runs memory-map it until any part changes
+	:return: sorted int64 array of de-duplicated IDs
+	"""
+	parts = find_archive_parts(source, basename)
+	if not parts:
+		logger.warning(f"{source}: no {basename}.js")
+		return []
+	ids = cached_ids(
+		source,
+		lambda: union(*(as_ids(x) for x in parse_archive_parts(parts, item_key, id_key))),
+		sidecar=Path(cache_dir) / f"{basename}.js.ids",
+		key=parts_key(parts),
+	)
+	logger.debug(f"{len(ids):,d} {basename} IDs read from {len(parts)} part(s) in {source}")
 	return ids
 
 
+def process_account(batch_id: int, acct_name: str) -> dict:
+	"""
+	Runs the pipeline for one account: account info, user info, following, then followers
+	:return: summary for the end-of-run report
+	"""
+	start_ts = monotonic()
+	acct_dict = process_acct_info(batch_id, acct_name)
+	acct_id = acct_dict["id"]
+	user_dict = process_user_info(acct_name, acct_id)
+	last_tweet = None
+	last_tweet_date = None
+	if "lastTweet" in user_dict:
+		last_tweet = user_dict["lastTweet"]
+	if "lastTweetDate" in user_dict:
+		last_tweet_date = user_dict["lastTweetDate"]
+	following = process_following(batch_id, acct_name, acct_id)
+	followers = process_followers(batch_id, acct_name, acct_id)
+	return {
+		"acct_name": acct_name,
+		"acct_id": acct_id,
+		"following": following,
+		"followers": followers,
+		"seconds": monotonic() - start_ts,
+	}
+
+
 def process_acct_info(batch_id: int, acct_name: str) -> dict:
 	"""
 	At present, the AccountInfo.json files don't contain lastTweet or lastTweetDate keys,
@@ -757,8 +918,11 @@ def process_acct_info(batch_id: int, acct_name: str) -> dict:
 	file_id = file_dict["file_id"]
 	# asof = datetime.fromtimestamp(getmtime(filename)).astimezone()
 	asof = file_dict["filedate"]
-	with open(filename) as acctfile:
-		acct_dict = json.load(acctfile)
+	acct_dict = jsonlib.load_file(filename)
+	if file_dict["skip"]:
+		# Already posted; the caller still needs the account details
+		return acct_dict
+	update_file_status(file_id, "R")
 	acct_name2 = acct_dict["username"]
 	if acct_name != acct_name2:
 		raise ValueError(
@@ -793,68 +957,248 @@ def process_acct_info(batch_id: int, acct_name: str) -> dict:
 				  AND dau.asof < EXCLUDED.asof
 			RETURNING id;
 		""".strip()
+		update_file_status(file_id, "J", trans)
 		result = trans.execute(text(sql), params)
 		if result.rowcount > 0:
 			# ToDo: When we get newer data
-			update_file_status(file_id, "P")
 			do_nothing()
-		if acct_dict:
-			update_file_status(file_id, "C")
+		update_file_status(file_id, "P", trans)
+	update_file_status(file_id, "C")
 	return acct_dict
 
 
-def process_followers(batch_id: int, acct_name: str, acct_id: int):
-	process_relationships(batch_id, "Followers", acct_name, acct_id)
-	return
+def process_followers(batch_id: int, acct_name: str, acct_id: int) -> dict | None:
+	return process_relationships(batch_id, "Followers", acct_name, acct_id)
 
 
-def process_following(batch_id: int, acct_name: str, acct_id: int) -> int | None:
-	process_relationships(batch_id, "Following", acct_name, acct_id)
-	return
+def process_following(batch_id: int, acct_name: str, acct_id: int) -> dict | None:
+	return process_relationships(batch_id, "Following", acct_name, acct_id)
 
 
-def process_relationships(batch_id: int, relation_type: str, acct_name: str, acct_id: int):
-	rows = []
+def process_relationships(
+	batch_id: int,
+	relation_type: str,
+	acct_name: str,
+	acct_id: int,
+	chunk_lines: int = RELATION_CHUNK_LINES,
+) -> dict | None:
+	"""
+	Streams a twscrape relationship file into a temporary table, chunk_lines at a time,
+	creating stub dt_user rows as needed and collecting its User IDs in a
+	de-duplicated temporary table.  Those are then merged into dt_relation,
+	chunk_lines at a time, and relations missing from the file are pruned against
+	the same table.  Memory use depends on chunk_lines, not on the file size.
+	The file is at J once it is loaded, and at P once it is merged and pruned.
+	Neither the ID table nor the merged batches are tracked, so resuming a batch
+	starts the file over from R and merges it again; that is safe only because
+	fn_relation_bulk() leaves relations that already match as they are
+	:return: counts of relations inserted, updated, unchanged and pruned
+	"""
+	counts = None
 	filename = None
 	operation = None
 	relation_type = relation_type.lower()
 	if relation_type == "following":
 		operation = "follow"
 		filename = _twscrape_data_dir / "Accounts" / acct_name / "Following.json"
-	elif relation_type == "follower":
-		pass
+	elif relation_type in ["follower", "followers"]:
+		relation_type = "followers"
+		operation = "follow"
+		filename = _twscrape_data_dir / "Accounts" / acct_name / "Followers.json"
 	else:
 		raise ValueError(f"Unrecognized relation_type: '{relation_type}'")
 	logger.debug(f"Processing {filename}")
 	file_dict = get_new_file_id(batch_id, filename)
 	file_id = file_dict["file_id"]
-	asof = datetime.fromtimestamp(getmtime(filename)).astimezone()
+	asof = file_dict["filedate"]
+	lines = file_dict["lines"]
+	if file_dict["skip"]:
+		return counts
 	update_file_status(file_id, "R")
-	loaded_rows = db_load_json(batch_id, relation_type, filename)
 
-	for user_id, username in loaded_rows:
-		"""
-		# Columns: user_id1, user_id2, asof, follows, blocked, muted
-		for user_id in user_ids:
-		"""
-		params = {
-			"operation": operation,
-			"in_user_id1": acct_id,
-			"in_user_id2": user_id,
-			"asof": asof,
-		}
-		if relation_type == "follower":
-			params.update({
-				"in_user_id1": user_id,
-				"in_user_id2": acct_id,
-			})
-		with engine.begin() as trans:
-			sql = "SELECT * FROM fn_relation(:operation, :in_user_id1, :in_user_id2, :asof);"
-			# I think this returns a list of IDs in dt_relation
-			rows = trans.execute(text(sql)).fetchall()
-			do_nothing()
+	incoming = relation_type == "followers"
+	tbl = f"tmp_json_{batch_id}_{file_id}"
+	ids_tbl = f"tmp_ids_{batch_id}_{file_id}"
+	# Unique per file: these outlive their transaction, on a pooled connection
+	view = f"tmp_{relation_type}_{batch_id}_{file_id}"
+	counts = {"inserted": 0, "updated": 0, "unchanged": 0, "pruned": 0}
+	with engine.connect() as conn:
+		with conn.begin():
+			setschema = f"SET search_path TO {schema},public;"
+			conn.execute(text(setschema))
+			conn.execute(text(f"CREATE TEMP TABLE {tbl} (j JSONB) ON COMMIT DELETE ROWS;"))
+			# Every User ID in the file, once; merged and pruned against after the last chunk
+			conn.execute(text(f"CREATE TEMP TABLE {ids_tbl} (user_id BIGINT PRIMARY KEY);"))
+			conn.execute(text(db_create_view(tbl, relation_type, view)))
+
+		try:
+			rows_read = 0
+			bytes_copied = 0
+			start_ts = monotonic()
+			for chunk_count, chunk in enumerate(read_line_chunks(filename, chunk_lines)):
+				with conn.begin():
+					bytes_copied += db_copy_chunk(conn, tbl, chunk)
+					stubs = db_insert_stub_users(conn, view, asof)
+					sql = f"""
+						INSERT INTO {ids_tbl}
+						SELECT DISTINCT user_id FROM {view} WHERE user_id IS NOT NULL
+						ON CONFLICT DO NOTHING;
+					""".strip()
+					conn.execute(text(sql))
+				rows_read += len(chunk)
+				elapsed = max(monotonic() - start_ts, 1e-6)
+				logger.info(
+					" ".join(
+						[
+							f"@{acct_name} {relation_type.capitalize()} chunk {chunk_count + 1}:",
+							f"{rows_read:,d} of {lines:,d} rows ({rows_read / max(lines, 1):.0%})",
+							f"{stubs:,d} new users",
+							f"{bytes_copied / elapsed / 2**20:,.1f} MiB/s",
+						]
+					)
+				)
+
+			# JSON loaded: every line is in the ID table, but no relation has been merged
+			update_file_status(file_id, "J")
+
+			# Each User ID once, however often it appears in the file
+			last_id = 0
+			while last_id is not None:
+				with conn.begin():
+					chunk_counts, last_id = db_merge_relations(
+						conn, ids_tbl, operation, acct_id, asof, incoming, last_id, chunk_lines
+					)
+				for k, v in chunk_counts.items():
+					counts[k] += v
 
-	return rows
+			with conn.begin():
+				# The file is a complete snapshot, so anything missing from it has ended
+				counts["pruned"] = db_prune_relations(
+					conn, ids_tbl, operation, acct_id, asof, incoming
+				)
+				update_file_rows(conn, file_id, counts)
+				update_file_status(file_id, "P", conn)
+		finally:
+			# Also after an error, so the next account on this connection starts clean
+			if conn.in_transaction():
+				conn.rollback()
+			with conn.begin():
+				conn.execute(text(f"DROP VIEW IF EXISTS {view};"))
+				conn.execute(text(f"DROP TABLE IF EXISTS {tbl}, {ids_tbl};"))
+	logger.info(
+		f"{acct_id:19d} @{acct_name:16s} {relation_type.capitalize()}: "
+		f"{counts['inserted']:,d} inserted, {counts['updated']:,d} updated, "
+		f"{counts['unchanged']:,d} unchanged, {counts['pruned']:,d} pruned"
+	)
+	update_file_status(file_id, "C")
+	return counts
+
+
+def process_users(batch_id: int) -> dict:
+	"""
+	Loads every new or changed profile in the twscrape Users directory into a
+	temporary table, projects them through the usertweet view, and upserts them into
+	dt_user in one statement, with the same change rules as fn_user_insert().
+	Each file goes through dt_file_control, like the relationship files
+	:return: counts of users inserted, updated and unchanged
+	"""
+	users_dir = _twscrape_data_dir / "Users"
+	filenames = sorted(users_dir.glob("*.json"))
+	counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+	if not filenames:
+		logger.warning(f"No user files found in {users_dir}")
+		return counts
+	# Registered like the relationship files, so unchanged profiles, and those
+	# already posted in a resumed batch, aren't read again
+	files = {}
+	for filename in filenames:
+		file_dict = get_new_file_id(batch_id, filename)
+		if file_dict and not file_dict["skip"]:
+			files[file_dict["file_id"]] = (filename, file_dict["filedate"])
+	if not files:
+		logger.info(f"Users: {len(filenames):,d} files, none new or changed")
+		return counts
+	file_ids = list(files)
+	update_file_status(file_ids, "R")
+	tbl = f"tmp_users_{batch_id}"
+	columns = [
+		"user_id",
+		"asof",
+		"username",
+		"displayname",
+		"created_at",
+		"followers_count",
+		"friends_count",
+		"listed_count",
+		"media_count",
+		"statuses_count",
+		"last_tweeted",
+		"blue",
+		"protected",
+		"verified",
+		"description",
+		"location",
+		"url",
+		"image_url",
+		"banner_url",
+	]
+	cols = ",".join(columns)
+	updates = ",\n\t\t\t\t".join(
+		f"{x} = EXCLUDED.{x}" for x in columns if x != "user_id"
+	)
+	# Same WHERE clause as fn_user_insert()
+	sql = f"""
+		WITH upserted AS (
+			INSERT INTO dt_user AS du ({cols})
+			SELECT DISTINCT ON (user_id) {cols}
+			FROM	tmp_usertweet
+			WHERE	user_id IS NOT NULL
+			ORDER BY user_id, asof DESC
+			ON CONFLICT (user_id) DO UPDATE
+			SET	{updates}
+			WHERE	du.user_id = EXCLUDED.user_id
+			  AND	du.statuses_count != EXCLUDED.statuses_count
+			  AND	du.asof < EXCLUDED.asof
+			RETURNING (xmax = 0) AS is_new
+		)
+		SELECT	COUNT(*) FILTER (WHERE is_new),
+			COUNT(*) FILTER (WHERE NOT is_new),
+			(SELECT COUNT(DISTINCT user_id) FROM tmp_usertweet WHERE user_id IS NOT NULL)
+		FROM	upserted;
+	""".strip()
+	start_ts = monotonic()
+	with engine.begin() as trans:
+		setschema = f"SET search_path TO {schema},public;"
+		trans.execute(text(setschema))
+		trans.execute(
+			text(f"CREATE TEMP TABLE {tbl} (asof TIMESTAMPTZ, j JSONB) ON COMMIT DROP;")
+		)
+		# One line per profile: asof <DELIMITER> compact JSON
+		dbapi_conn = trans.connection.driver_connection
+		with dbapi_conn.cursor() as cur:
+			with cur.copy(f"COPY {tbl} FROM STDIN {COPY_JSON_OPTIONS};") as copy:
+				for filename, asof in files.values():
+					user_dict = jsonlib.load_file(filename)
+					line = f"{asof.isoformat()}\x02{jsonlib.dumps(user_dict)}\n"
+					copy.write(line.encode())
+		update_file_status(file_ids, "J", trans)
+		trans.execute(text(db_create_view(tbl, "usertweet")))
+		# Profiles of the same user collapse into one row, so count users, not files
+		inserted, updated, staged = trans.execute(text(sql)).fetchone()
+		update_file_status(file_ids, "P", trans)
+	update_file_status(file_ids, "C")
+	counts.update(
+		{
+			"inserted": inserted,
+			"updated": updated,
+			"unchanged": staged - inserted - updated,
+		}
+	)
+	logger.info(
+		f"Users: {len(files):,d} of {len(filenames):,d} files in {monotonic() - start_ts:.1f}s, "
+		f"{inserted:,d} inserted, {updated:,d} updated, {counts['unchanged']:,d} unchanged"
+	)
+	return counts
 
 
 def process_user_info(acct_name: str, acct_id: int) -> dict:
@@ -868,8 +1212,7 @@ def process_user_info(acct_name: str, acct_id: int) -> dict:
 	last_tweet_date = None
 	user_info = _twscrape_data_dir / "Users" / f"{acct_name}_{acct_id}.json"
 	user_asof = datetime.fromtimestamp(getmtime(user_info)).astimezone()
-	with open(user_info) as userfile:
-		user_dict = json.load(userfile)
+	user_dict = jsonlib.load_file(user_info)
 	if "lastTweet" in user_dict:
 		last_tweet = user_dict["lastTweet"]
 	if "lastTweetDate" in user_dict:
@@ -878,6 +1221,22 @@ def process_user_info(acct_name: str, acct_id: int) -> dict:
 	return user_dict
 
 
+def read_line_chunks(filename: str | Path, chunk_lines: int):
+	"""
+	Yields a file's lines (as bytes) in lists of up to chunk_lines
+	"""
+	chunk = []
+	with open(filename, "rb") as fp:
+		for line in fp:
+			chunk.append(line)
+			if len(chunk) >= chunk_lines:
+				yield chunk
+				chunk = []
+	if chunk:
+		yield chunk
+	return
+
+
 def save_ids(filename, ids):
 	# fn_logger = logging.getLogger(__module__ + ".save_ids")
 	lines = []
@@ -898,89 +1257,59 @@ def save_ids(filename, ids):
 	return
 
 
-def snoozer(min_sleep, max_sleep=None):
-	"""
-	Sleep for for a specified amount of time; if max_sleep is specified,
-	a random number is generated
-	:param min_sleep: The minimum amount of time to sleep
-	:param max_sleep: The maximum amount of time to sleep, if supplied
-	:return: None
-	"""
-	# fn_logger = logging.getLogger("%s.snoozer" % __module__)
-	if type(min_sleep) not in [int, float]:
-		raise ValueError("min_sleep should be an int or float")
-	if max_sleep:
-		if type(max_sleep) not in [int, float]:
-			raise ValueError("max_sleep should be an int or float")
-		sleep_seconds = abs(uniform(min_sleep, max_sleep))
-	else:
-		sleep_seconds = abs(min_sleep)
-	start_ts = datetime.now().timestamp()
-	logger.debug("sleep(%f)" % sleep_seconds)
-	sleep(sleep_seconds)
-	stop_ts = datetime.now().timestamp()
-	actual_sleep = stop_ts - start_ts
-	if actual_sleep < sleep_seconds:
-		raise Exception("actual sleep less than requested sleep")
-	return
-
-
 def stringify(iterable, separator=","):
 	iterable = separator.join([str(x) for x in iterable])
 	return iterable
 
 
-def update_file_status(file_id: int, status: str):
-	params = {"file_id": file_id, "status": status[0].upper(), "status_date": _run_dt}
-	sql = f"UPDATE dt_file_control SET file_status = :status, status_date = :status_date;"
-	with engine.begin() as trans:
-		rowcount = trans.execute(text(sql), params).rowcount
+def update_file_rows(conn, file_id: int, counts: dict):
+	params = {
+		"file_id": file_id,
+		"db_rows": counts["inserted"] + counts["updated"] + counts.get("pruned", 0),
+		"rows_inserted": counts["inserted"],
+		"rows_updated": counts["updated"],
+		"rows_unchanged": counts["unchanged"],
+	}
+	sql = """
+		UPDATE dt_file_control
+		SET	db_rows = :db_rows,
+			rows_inserted = :rows_inserted,
+			rows_updated = :rows_updated,
+			rows_unchanged = :rows_unchanged
+		WHERE	id = :file_id;
+	""".strip()
+	conn.execute(text(sql), params)
 	return
 
 
-# ToDo: Change database function(s) to handle follow/unfollow, block/unblock, and mute/unmute operations
-def update_relations(acct_id: int, asof: datetime, relation_type: str, user_ids: list):
+def update_file_status(file_id: int | list, status: str, conn=None):
 	"""
-	Updates dt_relation; Both acct_id and user_id must exist in dt_user, beforehand
+	Moves one file, or a list of them, to a new status (see FILE_STATUS_TRANSITIONS)
+	:param conn: connection to use, when already inside the file's transaction
 	"""
-	if relation_type not in ["follower", "following", "friend", "blocked", "muted"]:
-		raise ValueError(f"Unrecognized relation type: '{relation_type}'")
-	if not user_ids:
-		raise ValueError("Nothing to process")
-	# ToDo: Follower IDs
-	operation = None
-	if relation_type in ["follower", "following", "friend"]:
-		operation = "follow"
-	elif relation_type == "blocked":
-		operation = "block"
-	elif relation_type == "muted":
-		operation = "mute"
+	status = status[0].upper()
+	if status not in FILE_STATUS_TRANSITIONS:
+		raise ValueError(f"Unrecognized file status: '{status}'")
+	file_ids = file_id if isinstance(file_id, list) else [file_id]
+	params = {
+		"file_ids": file_ids,
+		"status": status,
+		"status_date": _run_dt,
+		"allowed": [x or "" for x in FILE_STATUS_TRANSITIONS[status]],
+	}
+	sql = """
+		UPDATE dt_file_control
+		SET file_status = :status, status_date = :status_date
+		WHERE id = ANY(CAST(:file_ids AS BIGINT[]))
+		  AND COALESCE(file_status, '') = ANY(CAST(:allowed AS TEXT[]));
+	""".strip()
+	if conn is None:
+		with engine.begin() as trans:
+			rowcount = trans.execute(text(sql), params).rowcount
 	else:
-		raise ValueError(f"Unrecognized relation type: '{relation_type}'")
-	with engine.begin() as conn:
-		setschema = f"SET search_path TO {schema},public;"
-		conn.execute(text(setschema))
-		# Columns: user_id1, user_id2, asof, follows, blocked, muted
-		for user_id in user_ids:
-			params = {
-				"operation": operation,
-				"in_user_id1": acct_id,
-				"in_user_id2": user_id,
-				"asof": asof,
-			}
-			if relation_type == "follower":
-				params.update(
-					{
-						"in_user_id1": user_id,
-						"in_user_id2": acct_id,
-					}
-				)
-			sql = "SELECT * FROM fn_relation(:operation, :in_user_id1, :in_user_id2, :asof);"
-			results = conn.execute(text(sql), params)
-			do_nothing()
-
-		# ToDo: Process User IDs no longer related
-
+		rowcount = conn.execute(text(sql), params).rowcount
+	if rowcount < len(file_ids):
+		raise ValueError(f"File ID {file_id}: can't change file status to '{status}'")
 	return
 
 
@@ -1012,12 +1341,17 @@ if __name__ == "__main__":
 	_data_dir = Config.DATA_DIR
 	_twscrape_data_dir = Config.TWSCRAPE_DATA_DIR
 
+	freshness = FreshnessCache(Path(_data_dir) / "freshness.sqlite3")
+	rate_limiter = RateLimiter()
+	proxy_pool = ProxyPool(proxies_from_env(), Config.MYIP_URLS_HTTPS)
+
 	# Database Stuff
 	engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, echo=DEBUG)
 	schema = Config.DB_SCHEMA
 
 	# Tweet-related Configuration
 	_cache_days = Config.CACHE_DAYS
+	user_states = UserStates(engine, schema, freshness, _data_dir, _cache_days, _run_dt)
 	_min_batch_delay, _max_batch_delay = Config.BATCH_DELAY_RANGE
 	_min_error_delay, _max_error_delay = Config.ERROR_DELAY_RANGE
 	_min_search_delay, _max_search_delay = Config.SEARCH_DELAY_RANGE
@@ -1033,6 +1367,5 @@ if __name__ == "__main__":
 	interpreter. If this is set to False they will be propagated to the caller
 	and the return value of this function is the return value of invoke().
 	"""
-	# main(standalone_mode=False)
-	main()
+	main(standalone_mode=False)
 	eoj()
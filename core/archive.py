@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# archive.py - Sunday, October 18, 2026
+""" Streaming reader for Twitter data-archive .js files, extracted or zipped """
+__version__ = "0.1.0-dev5"
+
+import io
+import json
+import os
+import re
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from zipfile import ZipFile
+
+# id_type: (file basename, item key), eg. block.js = [{"blocking": {"accountId": ...}}]
+ARCHIVE_TYPES = {
+	"following": ("following", "following"),
+	"follower": ("follower", "follower"),
+	"blocked": ("block", "blocking"),
+	"muted": ("mute", "muting"),
+}
+# window.YTD.following.part0 = [ ... ]
+ARCHIVE_PREFIX = re.compile(r"\s*window\.YTD\.(?P<name>\w+)\.part(?P<part>\d+)\s*=\s*")
+# following.js, following-part1.js, following-part2.js, ...
+PART_NAME = r"{}(?:-part(?P<part>\d+))?\.js"
+READ_SIZE = 1024**2
+
+# Stdlib on purpose: streaming items out of a partial buffer needs raw_decode()'s end
+# offset, and none of jsonlib's faster backends can decode a prefix of a document
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+
+
+class ArchiveFormatError(ValueError):
+	pass
+
+
+def find_archive_member(zip_path, basename: str) -> str | None:
+	"""
+	:param basename: eg. 'following.js'; matched against the archive's data/ directory
+	:return: member name, eg. 'data/following.js', or None
+	"""
+	with ZipFile(zip_path) as zf:
+		for name in zf.namelist():
+			if name == f"data/{basename}" or name.endswith(f"/data/{basename}"):
+				return name
+	return None
+
+
+def find_archive_parts(source, basename: str) -> list:
+	"""
+	Finds every part of a data type, eg. following.js, following-part1.js, ...
+	:param source: archive zip, or the extracted data/ directory
+	:param basename: eg. 'following'
+	:return: [(filename, member)] in part order; member is None for extracted files
+	"""
+	pattern = re.compile(PART_NAME.format(re.escape(basename)))
+	parts = []
+	source = Path(source)
+	if source.suffix == ".zip":
+		with ZipFile(source) as zf:
+			for name in zf.namelist():
+				head, _, tail = name.rpartition("/")
+				match = pattern.fullmatch(tail)
+				if match and (head == "data" or head.endswith("/data")):
+					parts.append((int(match["part"] or 0), (source, name)))
+	elif source.is_dir():
+		for filename in source.iterdir():
+			match = pattern.fullmatch(filename.name)
+			if match:
+				parts.append((int(match["part"] or 0), (filename, None)))
+	return [part for _, part in sorted(parts, key=lambda x: x[0])]
+
+
+def find_archive_zip(data_dir, screen_name: str) -> Path | None:
+	"""
+	Looks for a downloaded archive as {data_dir}/{screen_name}.zip,
+	{data_dir}/{screen_name}-*.zip or {data_dir}/{screen_name}/*.zip.  The '-' keeps
+	eg. @pat from matching patrick.zip; screen names can't contain one, unlike '_'
+	:return: the most recently modified match, or None to use the extracted files
+	"""
+	data_dir = Path(data_dir)
+	candidates = list(data_dir.glob(f"{screen_name}.zip"))
+	candidates += list(data_dir.glob(f"{screen_name}-*.zip"))
+	candidates += list((data_dir / screen_name).glob("*.zip"))
+	if not candidates:
+		return None
+	return max(candidates, key=lambda x: x.stat().st_mtime)
+
+
+def iter_archive_ids(filename, id_type: str, id_key: str = "accountId", member: str = None):
+	"""
+	Yields the integer IDs from a follower.js / following.js / block.js / mute.js file,
+	eg. [{"following": {"accountId": "12", ...}}, ...]
+	Items without id_type/id_key are skipped
+	:param member: when set, filename is the archive zip and member the file within it
+	"""
+	if member:
+		items = iter_zip_items(filename, member)
+	else:
+		items = iter_archive_items(filename)
+	for item in items:
+		try:
+			yield int(item[id_type][id_key])
+		except (KeyError, TypeError, ValueError):
+			continue
+	return
+
+
+def iter_archive_items(filename, read_size: int = READ_SIZE):
+	"""
+	Yields the elements of the array assigned in an archive .js file, one at a time.
+	Only the current element and one read buffer are held in memory, however large
+	the file is.
+	:raises ArchiveFormatError: if the file is not a 'window.YTD.*.partN = [...]' assignment
+	"""
+	with open(filename, encoding="utf-8-sig") as fp:
+		yield from _iter_items(fp, filename, read_size)
+	return
+
+
+def iter_zip_items(zip_path, member: str, read_size: int = READ_SIZE):
+	"""
+	As iter_archive_items(), decompressing the member as it is read.  Nothing is
+	extracted to disk and no other member (eg. media) is opened
+	"""
+	with ZipFile(zip_path) as zf:
+		with zf.open(member) as raw:
+			fp = io.TextIOWrapper(raw, encoding="utf-8-sig")
+			yield from _iter_items(fp, f"{zip_path}:{member}", read_size)
+	return
+
+
+def parse_archive_parts(
+	parts: list, id_type: str, id_key: str = "accountId", jobs: int = None
+) -> list:
+	"""
+	Parses each part in its own worker process (in-process if there is only one)
+	:param parts: from find_archive_parts()
+	:return: one array('q') of IDs per part, in part order
+	"""
+	return parse_archive_types({id_type: (parts, id_type, id_key)}, jobs)[id_type]
+
+
+def parse_archive_types(tasks: dict, jobs: int = None) -> dict:
+	"""
+	Parses the parts of several data types in one pool, so eg. a large following.js
+	and a small block.js are worked on at the same time
+	:param tasks: {name: (parts, item key, id key)}
+	:return: {name: [array('q') per part, in part order]}
+	"""
+	args = [
+		(name, filename, member, item_key, id_key)
+		for name, (parts, item_key, id_key) in tasks.items()
+		for filename, member in parts
+	]
+	if jobs is None:
+		jobs = os.cpu_count() or 1
+	jobs = min(jobs, len(args))
+	if jobs <= 1:
+		arrays = [part_ids(*x[1:]) for x in args]
+	else:
+		with ProcessPoolExecutor(max_workers=jobs) as executor:
+			arrays = list(executor.map(part_ids, *list(zip(*args))[1:]))
+	results = {name: [] for name in tasks}
+	for x, ids in zip(args, arrays):
+		results[x[0]].append(ids)
+	return results
+
+
+def part_ids(filename, member: str | None, id_type: str, id_key: str) -> array:
+	"""
+	Worker for parse_archive_parts(); an int64 array pickles far smaller than a list
+	"""
+	return array("q", iter_archive_ids(filename, id_type, id_key, member=member))
+
+
+def parts_key(parts: list) -> tuple:
+	"""
+	Combines the parts' (CRC-32, size) or (mtime_ns, size) into one sidecar key,
+	so adding, removing or changing any part invalidates it
+	"""
+	keys = []
+	for filename, member in parts:
+		if member:
+			keys.append((str(member),) + zip_member_key(filename, member))
+		else:
+			stat = os.stat(filename)
+			keys.append((Path(filename).name, stat.st_mtime_ns, stat.st_size))
+	return zlib.crc32(repr(keys).encode()), sum(x[2] for x in keys)
+
+
+def read_archive_name(filename) -> tuple:
+	"""
+	:return: (name, part) from the file's 'window.YTD.<name>.part<N> =' prefix
+	"""
+	with open(filename, encoding="utf-8-sig") as fp:
+		match = ARCHIVE_PREFIX.match(fp.read(256))
+	if not match:
+		raise ArchiveFormatError(f"{filename}: missing 'window.YTD.*.partN =' prefix")
+	return match["name"], int(match["part"])
+
+
+def zip_member_key(zip_path, member: str) -> tuple:
+	"""
+	:return: (CRC-32, uncompressed size) from the zip directory, without reading the member
+	"""
+	with ZipFile(zip_path) as zf:
+		info = zf.getinfo(member)
+	return info.CRC, info.file_size
+
+
+def _iter_items(fp, name: str, read_size: int):
+	# The prefix has to fit in the first read
+	buf = fp.read(max(read_size, 4096))
+	match = ARCHIVE_PREFIX.match(buf)
+	if not match:
+		raise ArchiveFormatError(f"{name}: missing 'window.YTD.*.partN =' prefix")
+	pos = match.end()
+	if buf[pos : pos + 1] != "[":
+		raise ArchiveFormatError(f"{name}: expected '[' at offset {pos}")
+	pos += 1
+	eof = False
+	while True:
+		pos = _whitespace.match(buf, pos).end()
+		# Need at least one non-blank character to decide what comes next
+		if pos >= len(buf) and not eof:
+			chunk = fp.read(read_size)
+			eof = not chunk
+			buf = buf[pos:] + chunk
+			pos = 0
+			continue
+		if buf[pos : pos + 1] == "]":
+			return
+		if buf[pos : pos + 1] == ",":
+			pos += 1
+			continue
+		try:
+			item, end = _decoder.raw_decode(buf, pos)
+		except json.JSONDecodeError:
+			if eof:
+				raise ArchiveFormatError(f"{name}: truncated or invalid JSON")
+			# Element straddles the buffer boundary
+			chunk = fp.read(read_size)
+			eof = not chunk
+			buf = buf[pos:] + chunk
+			pos = 0
+			continue
+		if end >= len(buf) and not eof:
+			# A scalar may continue in the next chunk
+			chunk = fp.read(read_size)
+			eof = not chunk
+			buf = buf[pos:] + chunk
+			pos = 0
+			continue
+		yield item
+		pos = end
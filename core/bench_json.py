@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# bench_json.py - Sunday, October 18, 2026
+""" Times each installed JSON backend on the files our loaders read """
+__version__ = "0.1.0-dev0"
+
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import click
+from tabulate import tabulate
+
+import jsonlib
+
+
+@click.command()
+@click.option("-r", "--repeat", default=5, show_default=True, help="Best-of-N runs per backend")
+@click.argument("filenames", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def main(repeat, filenames):
+	"""
+	FILENAMES: eg. data/following.js (archive), AccountInfo.json (twscrape), requests.jsonl.
+	.js files have their 'window.YTD.*.partN = ' prefix removed first, .jsonl files are
+	decoded line by line, anything else as one document
+	"""
+	backends = jsonlib.available_backends()
+	rows = []
+	for filename in filenames:
+		payload = read_payload(filename)
+		size_mb = sum(len(x) for x in payload) / 2**20
+		timings = {
+			name: time_backend(loads, payload, repeat) for name, (loads, _) in backends.items()
+		}
+		baseline = timings["json"]
+		for name, elapsed in timings.items():
+			rows.append(
+				[
+					Path(filename).name,
+					name,
+					f"{size_mb:,.1f}",
+					f"{elapsed * 1000:,.1f}",
+					f"{size_mb / elapsed:,.1f}" if elapsed else "-",
+					f"{baseline / elapsed:.2f}x" if elapsed else "-",
+				]
+			)
+	print(
+		tabulate(
+			rows,
+			headers=["File", "Backend", "MiB", "Best ms", "MiB/s", "vs stdlib"],
+			colalign=("left", "left", "right", "right", "right", "right"),
+		)
+	)
+	return
+
+
+def read_payload(filename) -> list:
+	"""
+	Reads the file up front so only decoding is timed
+	:return: list of byte strings to decode
+	"""
+	with open(filename, "rb") as fp:
+		data = fp.read()
+	if filename.endswith(".jsonl"):
+		return [x for x in data.splitlines() if x.strip()]
+	if filename.endswith(".js"):
+		# Archive files are JavaScript assignments, not JSON
+		data = data[data.index(b"=") + 1 :]
+	return [data]
+
+
+def time_backend(loads, payload: list, repeat: int) -> float:
+	best = None
+	for _ in range(repeat):
+		start = perf_counter()
+		for item in payload:
+			loads(item)
+		elapsed = perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# fetch_engine.py - Sunday, October 18, 2026
+""" asyncio fetch engine: bounded concurrency with per-endpoint, per-identity pacing """
+__version__ = "0.1.0-dev3"
+
+import asyncio
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from random import uniform
+from time import monotonic
+from urllib.request import urlopen
+
+from ratelimit import bucket_name
+
+# index: position in the input, for line numbers; value: fetcher's return, unless error
+FetchResult = namedtuple("FetchResult", "index user_id identity value error elapsed")
+
+
+class FetchAborted(Exception):
+	pass
+
+
+class Pacer:
+	"""
+	Spaces the start of successive requests on one (endpoint, identity) by a random
+	delay in [min_delay, max_delay], like the sleep between users in the serial loop.
+	The first request goes out immediately.  With a RateLimiter, the slot is taken
+	from its named bucket instead, shared with every other process using it
+	"""
+
+	def __init__(
+		self, min_delay: float = 0, max_delay: float = 0, limiter=None, name: str = None
+	):
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self.limiter = limiter
+		self.name = name
+		self._lock = asyncio.Lock()
+		self._next_ts = 0.0
+
+	async def wait(self) -> None:
+		async with self._lock:
+			interval = uniform(self.min_delay, self.max_delay)
+			if self.limiter:
+				delay = self.limiter.reserve(self.name, interval)
+			else:
+				delay = self._next_ts - monotonic()
+				self._next_ts = max(self._next_ts, monotonic()) + interval
+			if delay > 0:
+				await asyncio.sleep(delay)
+		return
+
+	async def backoff(self, min_delay: float, max_delay: float) -> None:
+		"""
+		Takes an extra slot costing a random delay in [min_delay, max_delay] without
+		waiting for it, so the next request on this (endpoint, identity) waits that
+		much longer, in every process sharing the bucket
+		"""
+		async with self._lock:
+			interval = uniform(min_delay, max_delay)
+			if self.limiter:
+				self.limiter.reserve(self.name, interval)
+			else:
+				self._next_ts = max(self._next_ts, monotonic()) + interval
+		return
+
+
+class FetchEngine:
+	"""
+	Runs fetcher(user_id, identity) for each User ID on `concurrency` workers.  Worker i
+	uses identities[i % len(identities)] (eg. an account or proxy), and requests are paced
+	per (endpoint, identity), so throughput grows with the number of identities while each
+	one still honours the configured delay range.  Blocking fetchers (eg. snscrape) run in
+	a thread pool; coroutine functions are awaited.  Pass a ratelimit.RateLimiter to pace
+	against buckets shared with other processes.  Results are handed to on_result() on the
+	event loop's thread, one at a time, so it can write to the database directly
+	"""
+
+	def __init__(
+		self,
+		fetcher,
+		concurrency: int = 1,
+		delay_range: tuple = (0, 0),
+		identities: list = None,
+		endpoint: str = "user",
+		max_consecutive_errors: int = None,
+		limiter=None,
+		health=None,
+		error_delay_range: tuple = None,
+	):
+		"""
+		:param error_delay_range: (min, max) seconds an identity backs off after a
+			failed fetch, on top of delay_range
+		:param health: callable(identity) -> bool; a worker whose identity turns
+			unhealthy (eg. an ejected proxy) stops taking User IDs
+		"""
+		self.fetcher = fetcher
+		self.concurrency = max(int(concurrency), 1)
+		self.delay_range = delay_range
+		self.identities = list(identities) if identities else [None]
+		self.endpoint = endpoint
+		self.max_consecutive_errors = max_consecutive_errors
+		self.limiter = limiter
+		self.health = health
+		self.error_delay_range = error_delay_range
+		self._pacers = {}
+
+	def pacer(self, identity) -> Pacer:
+		key = (self.endpoint, identity)
+		if key not in self._pacers:
+			self._pacers[key] = Pacer(
+				*self.delay_range, limiter=self.limiter, name=bucket_name(*key)
+			)
+		return self._pacers[key]
+
+	async def run(self, user_ids, on_result=None) -> list:
+		"""
+		:param on_result: called with each FetchResult as it completes; an exception
+			raised there cancels the remaining work and propagates
+		:raises FetchAborted: after max_consecutive_errors failed fetches in a row, or
+			if every identity turned unhealthy with User IDs left
+		:return: FetchResults in completion order
+		"""
+		queue = asyncio.Queue()
+		for index, user_id in enumerate(user_ids):
+			queue.put_nowait((index, user_id))
+		results = []
+		state = {"consecutive_errors": 0}
+		# Pacers hold an asyncio.Lock, which must belong to this event loop
+		self._pacers = {}
+		executor = ThreadPoolExecutor(max_workers=self.concurrency)
+		workers = [
+			asyncio.create_task(
+				self._worker(
+					queue,
+					self.identities[i % len(self.identities)],
+					executor,
+					results,
+					state,
+					on_result,
+				)
+			)
+			for i in range(min(self.concurrency, queue.qsize()))
+		]
+		try:
+			await asyncio.gather(*workers)
+		except BaseException:
+			for worker in workers:
+				worker.cancel()
+			await asyncio.gather(*workers, return_exceptions=True)
+			raise
+		finally:
+			# Threads already running finish their request; none are waited for
+			executor.shutdown(wait=False, cancel_futures=True)
+		if not queue.empty():
+			raise FetchAborted(f"No healthy identities; {queue.qsize():,d} User IDs unfetched")
+		return results
+
+	def run_sync(self, user_ids, on_result=None) -> list:
+		return asyncio.run(self.run(user_ids, on_result=on_result))
+
+	async def _worker(self, queue, identity, executor, results, state, on_result):
+		loop = asyncio.get_running_loop()
+		while True:
+			if self.health and not self.health(identity):
+				return
+			try:
+				index, user_id = queue.get_nowait()
+			except asyncio.QueueEmpty:
+				return
+			await self.pacer(identity).wait()
+			start_ts = monotonic()
+			value, error = None, None
+			try:
+				if asyncio.iscoroutinefunction(self.fetcher):
+					value = await self.fetcher(user_id, identity)
+				else:
+					value = await loop.run_in_executor(executor, self.fetcher, user_id, identity)
+			except Exception as e:
+				error = e
+			result = FetchResult(index, user_id, identity, value, error, monotonic() - start_ts)
+			results.append(result)
+			if on_result:
+				on_result(result)
+			if error is None:
+				state["consecutive_errors"] = 0
+			else:
+				state["consecutive_errors"] += 1
+				if self.error_delay_range:
+					await self.pacer(identity).backoff(*self.error_delay_range)
+				if state["consecutive_errors"] == self.max_consecutive_errors:
+					raise FetchAborted(f"{self.max_consecutive_errors} consecutive errors")
+
+
+def url_fetcher(url_template: str, timeout: float = 30):
+	"""
+	Fetcher for a JSON endpoint, eg. a local stand-in server while testing:
+	url_fetcher("http://127.0.0.1:8080/users/{user_id}")
+	"""
+
+	def fetch(user_id, identity=None):
+		with urlopen(url_template.format(user_id=user_id), timeout=timeout) as response:
+			return json.load(response)
+
+	return fetch
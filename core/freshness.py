@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# freshness.py - Sunday, October 18, 2026
+""" Local SQLite mirror of user_id -> last dt_user / dt_issue asof, for offline classification """
+__version__ = "0.1.0-dev4"
+
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+ISSUE_KINDS = ("no_response", "no_tweets", "no_user", "other")
+
+
+class FreshnessCache:
+	"""
+	One row per User ID: when dt_user was last written (ok_asof) and when, and why,
+	dt_issue was last written (issue_asof, issue_kind), and when the profile is next
+	due (next_refresh, scheduled by the database).  dead marks IDs that
+	confirm_bad_user_ids() would confirm, so --local needs neither the Bloom filter
+	nor the database.  Timestamps are stored as
+	epoch seconds.  The connection is opened per process, so the cache can be used
+	from forked workers; SQLite's WAL mode lets them write concurrently
+	"""
+
+	def __init__(self, filename):
+		self.filename = Path(filename)
+		self._conn = None
+		self._pid = None
+
+	@property
+	def conn(self) -> sqlite3.Connection:
+		if self._conn is None or self._pid != os.getpid():
+			self.filename.parent.mkdir(parents=True, exist_ok=True)
+			self._conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+			self._pid = os.getpid()
+			self._conn.execute("PRAGMA journal_mode=WAL;")
+			self._conn.execute("PRAGMA synchronous=NORMAL;")
+			self._conn.executescript(
+				"""
+				CREATE TABLE IF NOT EXISTS freshness (
+					user_id		INTEGER PRIMARY KEY,
+					ok_asof		REAL,
+					issue_asof	REAL,
+					issue_kind	TEXT,
+					next_refresh	REAL,
+					dead		INTEGER NOT NULL DEFAULT 0
+				);
+				CREATE TABLE IF NOT EXISTS meta (
+					key		TEXT PRIMARY KEY,
+					value		TEXT
+				);
+				"""
+			)
+			# Caches written by earlier versions
+			columns = [x[1] for x in self._conn.execute("PRAGMA table_info(freshness);")]
+			if "next_refresh" not in columns:
+				self._conn.execute("ALTER TABLE freshness ADD COLUMN next_refresh REAL;")
+			if "dead" not in columns:
+				self._conn.execute(
+					"ALTER TABLE freshness ADD COLUMN dead INTEGER NOT NULL DEFAULT 0;"
+				)
+		return self._conn
+
+	def classify(self, user_ids, since: datetime, now: datetime = None) -> tuple:
+		"""
+		Same rules as get_user_id_states(), without a database round trip
+		:param now: compared with next_refresh; rows without one fall back to since
+		:return: (cached, bad) lists of User IDs
+		"""
+		since_ts = since.timestamp()
+		now_ts = (now or datetime.now().astimezone()).timestamp()
+		cached_ids = []
+		bad_ids = []
+		conn = self.conn
+		conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (user_id INTEGER PRIMARY KEY);")
+		conn.execute("BEGIN;")
+		try:
+			conn.execute("DELETE FROM lookup;")
+			conn.executemany(
+				"INSERT OR IGNORE INTO lookup VALUES (?);", ((int(x),) for x in user_ids)
+			)
+			rows = conn.execute(
+				"""
+				SELECT	f.user_id, COALESCE(f.next_refresh > :now, f.ok_asof > :since),
+					f.issue_asof > :since
+				FROM	lookup l
+				JOIN	freshness f ON f.user_id = l.user_id
+				WHERE	COALESCE(f.next_refresh > :now, f.ok_asof > :since)
+				   OR	f.issue_asof > :since;
+				""",
+				{"now": now_ts, "since": since_ts},
+			)
+			for user_id, cached, bad in rows:
+				if cached:
+					cached_ids.append(user_id)
+				if bad:
+					bad_ids.append(user_id)
+		finally:
+			conn.execute("ROLLBACK;")
+		return cached_ids, bad_ids
+
+	def dead_ids(self, user_ids) -> list:
+		"""
+		:return: those of user_ids flagged dead (see rebuild())
+		"""
+		conn = self.conn
+		conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (user_id INTEGER PRIMARY KEY);")
+		conn.execute("BEGIN;")
+		try:
+			conn.execute("DELETE FROM lookup;")
+			conn.executemany(
+				"INSERT OR IGNORE INTO lookup VALUES (?);", ((int(x),) for x in user_ids)
+			)
+			rows = conn.execute(
+				"""
+				SELECT	f.user_id
+				FROM	lookup l
+				JOIN	freshness f ON f.user_id = l.user_id
+				WHERE	f.dead;
+				"""
+			)
+			dead_ids = [x[0] for x in rows]
+		finally:
+			conn.execute("ROLLBACK;")
+		return dead_ids
+
+	def close(self) -> None:
+		if self._conn is not None and self._pid == os.getpid():
+			self._conn.close()
+		self._conn = None
+		return
+
+	def rebuilt_at(self) -> datetime | None:
+		row = self.conn.execute("SELECT value FROM meta WHERE key = 'rebuilt_at';").fetchone()
+		return datetime.fromisoformat(row[0]) if row else None
+
+	def rebuild(self, rows) -> int:
+		"""
+		Replaces the contents from the database, in one transaction
+		:param rows: iterable of (user_id, last_ok_asof, last_issue_asof, issue_kind,
+			next_refresh, dead), as in dt_user_freshness plus the confirm_bad_user_ids()
+			verdict; any timestamp may be None
+		:return: number of User IDs in the cache
+		"""
+		conn = self.conn
+		conn.execute("BEGIN IMMEDIATE;")
+		try:
+			conn.execute("DELETE FROM freshness;")
+			conn.executemany(
+				"INSERT INTO freshness VALUES (?, ?, ?, ?, ?, ?);",
+				(
+					(
+						int(user_id),
+						ok_asof.timestamp() if ok_asof else None,
+						issue_asof.timestamp() if issue_asof else None,
+						kind,
+						next_refresh.timestamp() if next_refresh else None,
+						int(bool(dead)),
+					)
+					for user_id, ok_asof, issue_asof, kind, next_refresh, dead in rows
+				),
+			)
+			conn.execute(
+				"INSERT OR REPLACE INTO meta VALUES ('rebuilt_at', ?);",
+				(datetime.now().astimezone().isoformat(),),
+			)
+			conn.execute("COMMIT;")
+		except BaseException:
+			conn.execute("ROLLBACK;")
+			raise
+		return conn.execute("SELECT COUNT(*) FROM freshness;").fetchone()[0]
+
+	def record_issue(self, user_id: int, asof: datetime, issue_kind: str) -> None:
+		"""
+		no_user marks the ID dead at once; no_response strikes are only counted by the
+		database, so those wait for the next rebuild
+		"""
+		self.conn.execute(
+			"""
+			INSERT INTO freshness (user_id, issue_asof, issue_kind, dead) VALUES (?, ?, ?, ?)
+			ON CONFLICT (user_id) DO UPDATE
+			SET issue_asof = excluded.issue_asof, issue_kind = excluded.issue_kind,
+				dead = dead OR excluded.dead;
+			""",
+			(int(user_id), asof.timestamp(), issue_kind, int(issue_kind == "no_user")),
+		)
+		return
+
+	def record_user(self, user_id: int, asof: datetime) -> None:
+		"""
+		Every successful fetch, whether or not dt_user changed.  The new schedule is
+		computed by the database, so next_refresh is cleared and the cache period
+		applies until the next rebuild
+		"""
+		self.conn.execute(
+			"""
+			INSERT INTO freshness (user_id, ok_asof) VALUES (?, ?)
+			ON CONFLICT (user_id) DO UPDATE
+			SET ok_asof = MAX(COALESCE(ok_asof, 0), excluded.ok_asof), next_refresh = NULL,
+				dead = 0;
+			""",
+			(int(user_id), asof.timestamp()),
+		)
+		return
+
+
+def issue_kind(no_response: bool, no_tweets: bool, no_user: bool) -> str:
+	"""
+	:return: one of ISSUE_KINDS, from dt_issue's flags
+	"""
+	if no_user:
+		return "no_user"
+	if no_response:
+		return "no_response"
+	if no_tweets:
+		return "no_tweets"
+	return "other"
@@ -3,9 +3,9 @@
 # get_whoami.py - Wednesday, October 13, 2021
 
 """ Get User Profile Information """
-__version__ = '0.5.142-dev1'
+__version__ = '0.5.142-dev4'
 
-import click, sys, traceback
+import click, os, sys, traceback
 import pandas as pd
 import snscrape.base
 import snscrape.modules.twitter as sntwitter
@@ -13,7 +13,7 @@ from datetime import datetime, timedelta, timezone
 from itertools import islice
 from munch import Munch
 from pathlib import Path
-from random import shuffle, uniform
+from random import shuffle
 from sqlalchemy import create_engine
 from tabulate import tabulate
 from time import sleep
@@ -22,6 +22,8 @@ parentdir = Path(__file__).resolve().parent.parent
 if parentdir not in sys.path:
 	sys.path.insert(0, str(parentdir))
 from config import Config
+from proxypool import proxy_label
+from ratelimit import RateLimiter, bucket_name, sleep_for
 
 
 @click.command()
@@ -47,8 +49,7 @@ def main(csv, database):
 	rows = []
 	tweets = []
 	for count, twit in enumerate(whoamis):
-		if count > 0:
-			sleep(uniform(3.3333, 7.7777))
+		rate_limiter.acquire(user_bucket, 3.3333, 7.7777)
 		retries = 3
 		while retries > 0:
 			try:
@@ -84,7 +85,7 @@ def main(csv, database):
 				retries -= 1
 				# print(e, file=sys.stderr)
 				print(traceback.print_exc(), file=sys.stderr)
-				sleep(400)
+				sleep_for(400)
 	columns = ['user_id', 'asof', 'username', 'displayname', 'created_at',
 	           'followers_count', 'friends_count', 'statuses_count',
 	           'last_tweeted']  # , 'listed_count'
@@ -239,6 +240,11 @@ if __name__ == '__main__':
 	engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
 	schema = Config.DB_SCHEMA
 
+	# Rate-limit buckets shared with other jobs
+	rate_limiter = RateLimiter()
+	# snscrape goes out through ALL_PROXY (or direct), like a pool of one
+	user_bucket = bucket_name("user", proxy_label(os.getenv("ALL_PROXY")))
+
 	try:
 		init()
 		main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# idarray.py - Sunday, October 18, 2026
+""" Sorted int64 arrays of User IDs with vectorized set operations """
+__version__ = "0.1.0-dev0"
+
+import os
+import struct
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+ID_DTYPE = np.int64
+# Sidecar header: magic, source key (mtime_ns or CRC, size), ID count; IDs follow at 32 bytes
+SIDECAR_HEADER = struct.Struct("<8sqqq")
+SIDECAR_MAGIC = b"IDARRAY1"
+SIDECAR_SUFFIX = ".ids"
+
+
+def as_ids(user_ids) -> np.ndarray:
+	"""
+	:param user_ids: list, set, array or iterable of IDs (ints or numeric strings)
+	:return: sorted array of unique IDs, 8 bytes per ID
+	"""
+	if isinstance(user_ids, np.ndarray):
+		arr = user_ids.astype(ID_DTYPE, copy=False)
+	elif isinstance(user_ids, array) and user_ids.itemsize == 8:
+		arr = np.frombuffer(user_ids, dtype=ID_DTYPE)
+	elif isinstance(user_ids, (list, tuple)):
+		arr = np.array(user_ids, dtype=ID_DTYPE)
+	else:
+		arr = np.fromiter((int(x) for x in user_ids), dtype=ID_DTYPE)
+	return np.unique(arr)
+
+
+def contains(user_ids: np.ndarray, values) -> np.ndarray:
+	"""
+	:return: boolean mask, True where values are in the sorted user_ids
+	"""
+	values = np.asarray(values, dtype=ID_DTYPE)
+	if not len(user_ids):
+		return np.zeros(len(values), dtype=bool)
+	pos = np.searchsorted(user_ids, values)
+	pos[pos == len(user_ids)] = 0
+	return user_ids[pos] == values
+
+
+def cached_ids(filename, build, sidecar=None, key: tuple = None) -> np.ndarray:
+	"""
+	Returns the IDs parsed from filename, memory-mapped from a binary sidecar when the
+	sidecar was written for the file's current mtime and size.  Otherwise calls
+	build() to parse the file, and rewrites the sidecar
+	:param build: callable returning an iterable of IDs
+	:param sidecar: defaults to filename + '.ids', alongside the source file
+	:param key: pair identifying the source contents, instead of (mtime_ns, size),
+		eg. (CRC-32, size) of a zip member
+	:return: sorted int64 array (read-only when memory-mapped)
+	"""
+	if key is None:
+		stat = os.stat(filename)
+		key = (stat.st_mtime_ns, stat.st_size)
+	if sidecar is None:
+		sidecar = f"{filename}{SIDECAR_SUFFIX}"
+	user_ids = read_sidecar(sidecar, key)
+	if user_ids is None:
+		user_ids = as_ids(build())
+		write_sidecar(sidecar, key, user_ids)
+	return user_ids
+
+
+def difference(user_ids: np.ndarray, *others: np.ndarray) -> np.ndarray:
+	"""
+	:return: IDs in user_ids but in none of the others
+	"""
+	for other in others:
+		user_ids = np.setdiff1d(user_ids, other, assume_unique=True)
+	return user_ids
+
+
+def intersect(user_ids: np.ndarray, other: np.ndarray) -> np.ndarray:
+	return np.intersect1d(user_ids, other, assume_unique=True)
+
+
+def union(*arrays: np.ndarray) -> np.ndarray:
+	if not arrays:
+		return np.empty(0, dtype=ID_DTYPE)
+	return np.unique(np.concatenate(arrays)).astype(ID_DTYPE, copy=False)
+
+
+def read_sidecar(sidecar, key: tuple) -> np.ndarray | None:
+	"""
+	:param key: (mtime_ns, size) of the source file
+	:return: memory-mapped IDs, or None if the sidecar is missing, corrupt or stale
+	"""
+	try:
+		with open(sidecar, "rb") as fp:
+			header = fp.read(SIDECAR_HEADER.size)
+		sidecar_size = os.path.getsize(sidecar)
+	except OSError:
+		return None
+	if len(header) != SIDECAR_HEADER.size:
+		return None
+	magic, mtime_ns, size, count = SIDECAR_HEADER.unpack(header)
+	if magic != SIDECAR_MAGIC or (mtime_ns, size) != key:
+		return None
+	if sidecar_size != SIDECAR_HEADER.size + count * np.dtype(ID_DTYPE).itemsize:
+		return None
+	if not count:
+		return np.empty(0, dtype=ID_DTYPE)
+	return np.memmap(
+		sidecar, dtype=ID_DTYPE, mode="r", offset=SIDECAR_HEADER.size, shape=(count,)
+	)
+
+
+def write_sidecar(sidecar, key: tuple, user_ids: np.ndarray) -> None:
+	"""
+	Writes to a temporary file and renames it, so readers never see a partial sidecar
+	"""
+	sidecar = Path(sidecar)
+	tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}")
+	try:
+		with open(tmp, "wb") as fp:
+			fp.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, key[0], key[1], len(user_ids)))
+			fp.write(np.ascontiguousarray(user_ids, dtype=ID_DTYPE).tobytes())
+		os.replace(tmp, sidecar)
+	except OSError:
+		# Read-only archive directory etc.; the caller still has the parsed IDs
+		tmp.unlink(missing_ok=True)
+	return
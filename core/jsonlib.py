@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# jsonlib.py - Sunday, October 18, 2026
+""" JSON decoding with the fastest installed backend, falling back to stdlib """
+__version__ = "0.1.0-dev1"
+
+import json
+import os
+from importlib import import_module
+
+# Order of preference; JSONLIB_BACKEND overrides
+BACKEND_ORDER = ("orjson", "simdjson", "rapidjson", "ujson", "json")
+
+
+def _make_orjson(mod):
+	def dumps(obj) -> str:
+		return mod.dumps(obj).decode()
+
+	return mod.loads, dumps
+
+
+def _make_simdjson(mod):
+	# pysimdjson's loads() materialises plain dicts/lists; it has no encoder
+	return mod.loads, json.dumps
+
+
+def _make_rapidjson(mod):
+	return mod.loads, mod.dumps
+
+
+def _make_ujson(mod):
+	return mod.loads, mod.dumps
+
+
+def _make_json(mod):
+	return mod.loads, mod.dumps
+
+
+_FACTORIES = {
+	"orjson": _make_orjson,
+	"simdjson": _make_simdjson,
+	"rapidjson": _make_rapidjson,
+	"ujson": _make_ujson,
+	"json": _make_json,
+}
+
+
+def available_backends() -> dict:
+	"""
+	:return: {name: (loads, dumps)} for every backend that can be imported
+	"""
+	backends = {}
+	for name in BACKEND_ORDER:
+		try:
+			mod = import_module(name)
+		except ImportError:
+			continue
+		try:
+			backends[name] = _FACTORIES[name](mod)
+		except AttributeError:
+			# Unrelated package installed under the same name
+			continue
+	return backends
+
+
+def dump(obj, fp) -> None:
+	fp.write(dumps(obj))
+	return
+
+
+def load(fp):
+	"""
+	Decodes an open file, text or binary; use load_file() for a filename, which reads
+	bytes so the byte-oriented backends skip a decode step
+	"""
+	return loads(fp.read())
+
+
+def load_file(filename):
+	with open(filename, "rb") as fp:
+		return loads(fp.read())
+
+
+def select_backend(name: str = None) -> str:
+	"""
+	Points loads()/dumps() at the named backend, or the first one installed
+	:return: name of the backend in use
+	"""
+	global BACKEND, loads, dumps
+	backends = available_backends()
+	if name:
+		if name not in backends:
+			raise ValueError(f"JSON backend '{name}' is not installed, choose from {list(backends)}")
+	else:
+		name = next(iter(backends))
+	BACKEND = name
+	loads, dumps = backends[name]
+	return name
+
+
+BACKEND = None
+loads, dumps = json.loads, json.dumps
+select_backend(os.environ.get("JSONLIB_BACKEND"))
@@ -82,6 +82,25 @@ class UserHistory(Base):
 		return "<User: @%s id: %d Asof: %s>" % (self.username, self.user_id, self.asof)
 
 
+# Maintained by triggers on dt_user & dt_issue (sqitch: dt_user_freshness)
+class UserFreshness(Base):
+	__table__ = Table(
+		'dt_user_freshness',
+		Base.metadata,
+		Column('user_id', BigInteger, primary_key=True, autoincrement=False),
+		Column('last_ok_asof', DateTime(timezone=True)),
+		Column('last_issue_asof', DateTime(timezone=True)),
+		Column('issue_kind', String),
+		Column('next_refresh', DateTime(timezone=True), index=True),
+		schema=schema,
+	)
+
+	def __repr__(self):
+		return "<UserFreshness: id: %d OK: %s Issue: %s>" % (
+			self.user_id, self.last_ok_asof, self.last_issue_asof
+		)
+
+
 """class Status(Base):
 	__table__ = Table(
 		'dt_status',
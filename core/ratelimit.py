@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ratelimit.py - Sunday, October 18, 2026
+""" Named rate-limit buckets shared by every process on the host, through SQLite """
+__version__ = "0.1.0-dev0"
+
+import os
+import sqlite3
+from pathlib import Path
+from random import uniform
+from time import sleep, time
+
+
+class RateLimiter:
+	"""
+	One bucket per name, eg. 'user' or 'follow:some_account', kept in a small SQLite
+	database so that concurrent jobs draw on the same buckets.  Each bucket is a
+	GCRA (generic cell rate algorithm) token bucket: a single 'theoretical arrival
+	time' per name.  A caller reserves its slot in one short IMMEDIATE transaction
+	and then sleeps outside the lock, so waiting processes don't hold the database
+	"""
+
+	def __init__(self, filename=None):
+		self.filename = Path(filename or default_path())
+		self._conn = None
+		self._pid = None
+
+	@property
+	def conn(self) -> sqlite3.Connection:
+		if self._conn is None or self._pid != os.getpid():
+			self.filename.parent.mkdir(parents=True, exist_ok=True)
+			self._conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+			self._pid = os.getpid()
+			self._conn.execute("PRAGMA journal_mode=WAL;")
+			self._conn.execute("PRAGMA synchronous=NORMAL;")
+			self._conn.execute(
+				"""
+				CREATE TABLE IF NOT EXISTS bucket (
+					name		TEXT PRIMARY KEY,
+					tat		REAL NOT NULL,
+					updated		REAL NOT NULL
+				);
+				"""
+			)
+		return self._conn
+
+	def acquire(
+		self, name: str, min_interval: float, max_interval: float = None, burst: int = 1
+	) -> float:
+		"""
+		Blocks until the bucket allows one more request.  With max_interval, each
+		request costs a random interval in [min_interval, max_interval], as snoozer()
+		used to sleep; unlike snoozer(), the first request in a while goes straight out
+		:return: seconds waited
+		"""
+		if max_interval:
+			interval = abs(uniform(min_interval, max_interval))
+		else:
+			interval = abs(min_interval)
+		delay = self.reserve(name, interval, burst)
+		sleep_for(delay)
+		return delay
+
+	def close(self) -> None:
+		if self._conn is not None and self._pid == os.getpid():
+			self._conn.close()
+		self._conn = None
+		return
+
+	def reserve(self, name: str, interval: float, burst: int = 1) -> float:
+		"""
+		Takes the next slot in the bucket without waiting for it
+		:param interval: seconds each request costs
+		:param burst: requests allowed back to back after the bucket has been idle
+		:return: seconds until the slot; the caller must wait that long
+		"""
+		conn = self.conn
+		conn.execute("BEGIN IMMEDIATE;")
+		try:
+			now = time()
+			row = conn.execute("SELECT tat FROM bucket WHERE name = ?;", (name,)).fetchone()
+			tat = max(row[0], now) if row else now
+			delay = max(tat - (burst - 1) * interval - now, 0.0)
+			conn.execute(
+				"""
+				INSERT INTO bucket (name, tat, updated) VALUES (?, ?, ?)
+				ON CONFLICT (name) DO UPDATE SET tat = excluded.tat, updated = excluded.updated;
+				""",
+				(name, tat + interval, now),
+			)
+			conn.execute("COMMIT;")
+		except BaseException:
+			conn.execute("ROLLBACK;")
+			raise
+		return delay
+
+
+def bucket_name(endpoint: str, identity=None) -> str:
+	"""
+	:return: eg. 'follow' or 'follow:some_account'
+	"""
+	if identity is None or identity == "":
+		return endpoint
+	return f"{endpoint}:{identity}"
+
+
+def default_path() -> Path:
+	"""
+	Same directory as the PID files, so every job run by this user shares one database
+	"""
+	run_dir = f"/run/user/{os.geteuid()}"
+	if not os.path.isdir(run_dir):
+		run_dir = "/tmp"
+	return Path(run_dir) / "ratelimit.sqlite3"
+
+
+def sleep_for(seconds: float) -> None:
+	"""
+	Sleeps until the deadline, even if the OS wakes the process early
+	"""
+	deadline = time() + seconds
+	while (remaining := deadline - time()) > 0:
+		sleep(remaining)
+	return
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# userstate.py - Sunday, October 18, 2026
+""" Cached / bad / to-fetch classification of User IDs, shared by the acct_maint scripts """
+__version__ = "0.1.0-dev3"
+
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+from os.path import exists, getmtime
+from pathlib import Path
+from time import monotonic
+
+import pandas as pd
+from sqlalchemy import text
+
+from bloom import BloomFilter
+from idarray import as_ids, difference, intersect, union
+
+# dt_user columns returned by get_cached_users() / iter_cached_users()
+CACHED_USER_COLUMNS = [
+	"user_id",
+	"asof",
+	"username",
+	"displayname",
+	"created_at",
+	"followers_count",
+	"friends_count",
+	"listed_count",
+	"statuses_count",
+	"last_tweeted",
+]
+DT_USER_COLUMNS = CACHED_USER_COLUMNS + [
+	"media_count",
+	"blue",
+	"protected",
+	"verified",
+	"default_profile",
+	"description",
+	"label",
+	"location",
+	"url",
+	"image_url",
+	"banner_url",
+]
+
+# Bloom filter of User IDs not worth fetching: no_user, or no_response this many times
+BAD_FILTER_FP_RATE = 0.001
+BAD_FILTER_MAX_AGE = timedelta(hours=24)
+NO_RESPONSE_STRIKES = 3
+
+logger = logging.getLogger(__name__)
+
+
+class UserStates:
+	"""
+	Reads dt_user, dt_user_freshness and dt_issue for one run.  cache_days is the
+	cache period (Config.CACHE_DAYS), the fallback for users without a refresh
+	schedule; the Bloom filter of bad User IDs is kept in data_dir
+	"""
+
+	def __init__(
+		self,
+		engine,
+		schema: str,
+		freshness,
+		data_dir,
+		cache_days: int,
+		run_dt: datetime = None,
+	):
+		"""
+		:param freshness: FreshnessCache, for rebuild_freshness()
+		:param run_dt: the run's start time; compared with next_refresh
+		"""
+		self.engine = engine
+		self.schema = schema
+		self.freshness = freshness
+		self.data_dir = Path(data_dir)
+		self.cache_days = cache_days
+		self.run_dt = run_dt or datetime.now().astimezone().replace(microsecond=0)
+		self._bad_filter = None
+
+	@property
+	def since(self) -> datetime:
+		"""
+		Start of the cache period
+		"""
+		return self.run_dt.replace(microsecond=0) - timedelta(days=self.cache_days)
+
+	def classify_user_ids(self, following_ids, follower_ids, local: bool = False) -> dict:
+		"""
+		Splits an account's following & follower IDs into cached, bad (recent issue) and
+		to-fetch, with one query for both relation types
+		:param local: classify from the local freshness cache, without a database round trip
+		:return: dict of sorted int64 arrays, keyed by category, plus per-relation subsets
+		"""
+		following_ids = as_ids(following_ids)
+		follower_ids = as_ids(follower_ids)
+		all_ids = union(following_ids, follower_ids)
+		if local:
+			cached_ids, bad_ids = self.freshness.classify(
+				all_ids.tolist(), self.since, now=self.run_dt
+			)
+			cached_ids, bad_ids = as_ids(cached_ids), as_ids(bad_ids)
+		else:
+			cached_ids, bad_ids = self.get_user_id_states(all_ids)
+		fetch_ids = difference(all_ids, cached_ids, bad_ids)
+		# Suspended/deleted accounts outside the cache period
+		if local:
+			# Flagged when the cache was rebuilt, so no database round trip here either
+			dead_ids = as_ids(self.freshness.dead_ids(fetch_ids.tolist()))
+			logger.info(f"Freshness cache: {len(dead_ids):,d} bad User IDs to skip")
+		else:
+			# Only Bloom filter hits are queried
+			hits = fetch_ids[self.get_bad_filter().contains(fetch_ids)]
+			dead_ids = as_ids(self.confirm_bad_user_ids(hits) if len(hits) else [])
+			if len(hits):
+				logger.info(
+					f"Bad User ID filter: {len(hits):,d} hits, {len(dead_ids):,d} confirmed"
+				)
+		if len(dead_ids):
+			fetch_ids = difference(fetch_ids, dead_ids)
+			bad_ids = union(bad_ids, dead_ids)
+		return {
+			"following": following_ids,
+			"follower": follower_ids,
+			"cached": cached_ids,
+			"bad": bad_ids,
+			"fetch": fetch_ids,
+			"cached_following": intersect(following_ids, cached_ids),
+			"cached_follower": intersect(follower_ids, cached_ids),
+		}
+
+	def confirm_bad_user_ids(self, user_ids) -> list:
+		"""
+		Exact check of Bloom filter hits: IDs flagged no_user, or no_response at least
+		NO_RESPONSE_STRIKES times, and not seen in dt_user since
+		"""
+		params = {"user_ids": [int(x) for x in user_ids], "strikes": NO_RESPONSE_STRIKES}
+		sql = """
+			SELECT	di.user_id
+			FROM	dt_issue di
+			LEFT JOIN dt_user du ON du.user_id = di.user_id
+			WHERE	di.user_id = ANY(CAST(:user_ids AS BIGINT[]))
+			  AND	(du.asof IS NULL OR du.asof < di.asof)
+			  AND	(di.no_user OR (
+					di.no_response AND (
+						SELECT COUNT(*) FROM dt_issue_history dh
+						WHERE dh.user_id = di.user_id AND dh.no_response
+					) >= :strikes
+				));
+		""".strip()
+		with self.engine.connect() as conn:
+			setschema = f"SET search_path TO {self.schema},public;"
+			conn.execute(text(setschema))
+			bad_user_ids = [x[0] for x in conn.execute(text(sql), params)]
+		return bad_user_ids
+
+	def get_bad_filter(self) -> BloomFilter:
+		"""
+		Bloom filter of User IDs flagged no_user, or no_response at least
+		NO_RESPONSE_STRIKES times.  Loaded from data_dir when less than
+		BAD_FILTER_MAX_AGE old, otherwise rebuilt from dt_issue / dt_issue_history and saved
+		"""
+		if self._bad_filter is not None:
+			return self._bad_filter
+		filename = self.data_dir / "bad_user_ids.bloom"
+		if exists(filename):
+			age = self.run_dt - datetime.fromtimestamp(getmtime(filename)).astimezone()
+			if age < BAD_FILTER_MAX_AGE:
+				try:
+					self._bad_filter = BloomFilter.load(filename)
+					return self._bad_filter
+				except (OSError, ValueError) as e:
+					logger.warning(e)
+		sql = """
+			SELECT	user_id FROM dt_issue WHERE no_user
+			UNION
+			SELECT	user_id FROM dt_issue_history WHERE no_response
+			GROUP BY user_id HAVING COUNT(*) >= :strikes;
+		""".strip()
+		with self.engine.connect() as conn:
+			setschema = f"SET search_path TO {self.schema},public;"
+			conn.execute(text(setschema))
+			rows = conn.execute(text(sql), {"strikes": NO_RESPONSE_STRIKES})
+			user_ids = as_ids(x[0] for x in rows)
+		# Headroom for issues recorded before the next rebuild
+		bad_filter = BloomFilter.for_capacity(len(user_ids) * 1.25 + 1000, BAD_FILTER_FP_RATE)
+		bad_filter.add(user_ids)
+		try:
+			bad_filter.save(filename)
+		except OSError as e:
+			logger.warning(f"Bad User ID filter not saved: {e}")
+		logger.info(f"Bad User ID filter built: {len(user_ids):,d} IDs")
+		self._bad_filter = bad_filter
+		return bad_filter
+
+	def get_cached_users(self, user_ids, columns: list = None) -> pd.DataFrame:
+		"""
+		All cached users among user_ids as one DataFrame; see iter_cached_users()
+		"""
+		chunks = list(self.iter_cached_users(user_ids, columns=columns, as_frame=True))
+		if not chunks:
+			return pd.DataFrame(columns=columns or CACHED_USER_COLUMNS)
+		return pd.concat(chunks, ignore_index=True)
+
+	def get_user_id_states(self, user_ids) -> tuple:
+		"""
+		Classifies User IDs in a single query, binding them as one BIGINT[] parameter
+		rather than an IN (...) list that has to be parsed and planned on every call.
+		Only dt_user_freshness is read, an index-only join on its primary key, which
+		covers last_ok_asof, last_issue_asof and next_refresh
+		- cached: in dt_user and not yet due; next_refresh is scheduled from the user's
+		  activity in dt_user_history by schedule_refreshes(), falling back to the cache
+		  period for users fetched since
+		- bad: in dt_issue within the cache period
+		Only IDs that are cached or bad come back; the rest are to be fetched
+		:return: (cached, bad) as sorted int64 arrays
+		"""
+		user_ids = as_ids(user_ids)
+		if not len(user_ids):
+			return user_ids, user_ids
+		params = {"user_ids": user_ids.tolist(), "now": self.run_dt, "since": self.since}
+		sql = """
+			SELECT	u.id,
+				COALESCE(uf.next_refresh > :now, uf.last_ok_asof > :since, false) cached,
+				COALESCE(uf.last_issue_asof > :since, false) bad
+			FROM	unnest(CAST(:user_ids AS BIGINT[])) u(id)
+			JOIN	dt_user_freshness uf ON uf.user_id = u.id
+			WHERE	COALESCE(uf.next_refresh > :now, uf.last_ok_asof > :since)
+			   OR	uf.last_issue_asof > :since;
+		""".strip()
+		cached_ids = []
+		bad_ids = []
+		with self.engine.connect() as conn:
+			setschema = f"SET search_path TO {self.schema},public;"
+			conn.execute(text(setschema))
+			for user_id, cached, bad in conn.execute(text(sql), params):
+				if cached:
+					cached_ids.append(user_id)
+				if bad:
+					bad_ids.append(user_id)
+		return as_ids(cached_ids), as_ids(bad_ids)
+
+	def iter_cached_users(
+		self,
+		user_ids,
+		columns: list = None,
+		since: datetime = None,
+		page_size: int = 10_000,
+		as_frame: bool = False,
+	):
+		"""
+		Streams the dt_user rows for user_ids refreshed since `since` (default: the last
+		24 hours) through a server-side cursor, page_size rows at a time, so memory
+		stays flat however many users match
+		:param columns: subset of dt_user columns to fetch (default: CACHED_USER_COLUMNS)
+		:param as_frame: yield one DataFrame per page instead of one record per user
+		:return: generator of CachedUser namedtuples, or of DataFrames
+		"""
+		if columns is None:
+			columns = CACHED_USER_COLUMNS
+		unknown = set(columns) - set(DT_USER_COLUMNS)
+		if unknown:
+			raise ValueError(f"Unknown dt_user columns: {sorted(unknown)}")
+		if since is None:
+			since = self.run_dt.replace(microsecond=0) - timedelta(hours=24)
+		params = {"user_ids": [int(x) for x in user_ids], "since": since}
+		sql = f"""
+			SELECT	{", ".join(columns)}
+			FROM	dt_user
+			WHERE	user_id = ANY(CAST(:user_ids AS BIGINT[]))
+			  AND	asof > :since
+			ORDER BY user_id;
+		""".strip()
+		record = namedtuple("CachedUser", columns)
+		with self.engine.connect() as conn:
+			setschema = f"SET search_path TO {self.schema},public;"
+			conn.execute(text(setschema))
+			result = conn.execution_options(stream_results=True, yield_per=page_size).execute(
+				text(sql), params
+			)
+			for page in result.partitions(page_size):
+				if as_frame:
+					yield pd.DataFrame(page, columns=columns)
+				else:
+					yield from (record._make(x) for x in page)
+		return
+
+	def rebuild_freshness(self) -> int:
+		"""
+		Reloads the local freshness cache from dt_user_freshness, through a server-side
+		cursor, flagging the IDs confirm_bad_user_ids() would confirm
+		:return: number of User IDs in the cache
+		"""
+		sql = """
+			SELECT	uf.user_id, uf.last_ok_asof, uf.last_issue_asof, uf.issue_kind,
+				uf.next_refresh,
+				COALESCE(uf.last_ok_asof IS NULL OR uf.last_ok_asof < uf.last_issue_asof, false)
+				AND (uf.issue_kind = 'no_user' OR COALESCE(dh.strikes >= :strikes, false)) dead
+			FROM	dt_user_freshness uf
+			LEFT JOIN (
+				SELECT	user_id, COUNT(*) strikes
+				FROM	dt_issue_history
+				WHERE	no_response
+				GROUP BY user_id
+			) dh ON dh.user_id = uf.user_id AND uf.issue_kind = 'no_response';
+		""".strip()
+		# So the cache gets this run's schedules, too
+		self.schedule_refreshes()
+		start_ts = monotonic()
+		with self.engine.connect() as conn:
+			setschema = f"SET search_path TO {self.schema},public;"
+			conn.execute(text(setschema))
+			stream = conn.execution_options(stream_results=True, yield_per=50_000)
+			rows = (
+				tuple(x)
+				for x in stream.execute(text(sql), {"strikes": NO_RESPONSE_STRIKES})
+			)
+			count = self.freshness.rebuild(rows)
+		logger.info(
+			f"Freshness cache rebuilt: {count:,d} User IDs in {monotonic() - start_ts:.1f}s"
+		)
+		return count
+
+	def schedule_refreshes(self) -> int:
+		"""
+		Computes next_refresh for every user fetched since this was last run; dt_user
+		writes only clear it (fn_user_schedule_refresh).  Run at the end of a run
+		:return: number of users scheduled
+		"""
+		start_ts = monotonic()
+		with self.engine.begin() as conn:
+			setschema = f"SET search_path TO {self.schema},public;"
+			conn.execute(text(setschema))
+			count = conn.execute(text("SELECT fn_user_schedule_refresh();")).scalar()
+		logger.info(
+			f"Refreshes scheduled: {count:,d} User IDs in {monotonic() - start_ts:.1f}s"
+		)
+		return count
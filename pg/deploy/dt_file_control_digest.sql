@@ -0,0 +1,20 @@
+-- Deploy acct_maint_2023:dt_file_control_digest to pg
+-- requires: dt_file_control
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+ALTER TABLE dt_file_control
+	ADD COLUMN file_size	BIGINT,
+	ADD COLUMN digest	TEXT,
+	ADD COLUMN skipped_for	BIGINT REFERENCES dt_file_control(id);
+
+CREATE INDEX idx_file_digest_size ON dt_file_control(digest, file_size);
+
+COMMENT ON COLUMN dt_file_control.file_size IS 'File size in bytes';
+COMMENT ON COLUMN dt_file_control.digest IS 'MD5 digest of the file contents';
+COMMENT ON COLUMN dt_file_control.skipped_for IS 'Previously posted file with the same contents (File ID)';
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Deploy acct_maint_2023:dt_file_control_rows to pg
+-- requires: dt_file_control
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+ALTER TABLE dt_file_control
+	ADD COLUMN rows_inserted	INT,
+	ADD COLUMN rows_updated		INT,
+	ADD COLUMN rows_unchanged	INT;
+
+COMMENT ON COLUMN dt_file_control.rows_inserted IS 'Number of rows inserted into the target table';
+COMMENT ON COLUMN dt_file_control.rows_updated IS 'Number of rows updated in the target table';
+COMMENT ON COLUMN dt_file_control.rows_unchanged IS 'Number of rows already current in the target table';
+
+COMMIT;
@@ -0,0 +1,81 @@
+-- Deploy acct_maint_2023:dt_file_status_history to pg
+-- requires: dt_file_control
+-- requires: dt_batch_control
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+-- TABLE: dt_file_status_history
+CREATE TABLE dt_file_status_history (
+	hist_id		BIGINT PRIMARY KEY GENERATED ALWAYS AS IDENTITY (START WITH 10000001),
+	file_id		BIGINT NOT NULL REFERENCES dt_file_control(id),
+	batch_id	BIGINT NOT NULL,
+	old_status	CHAR(1),
+	new_status	CHAR(1),
+	asof		TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Indexes
+CREATE INDEX idx_file_status_hist_file_id ON dt_file_status_history(file_id);
+CREATE INDEX idx_file_status_hist_batch_id ON dt_file_status_history(batch_id);
+CREATE INDEX idx_file_status_hist_asof ON dt_file_status_history(asof);
+
+-- Comments
+COMMENT ON TABLE  dt_file_status_history IS 'File Status History (File Control)';
+COMMENT ON COLUMN dt_file_status_history.hist_id IS 'History ID (Primary Key)';
+COMMENT ON COLUMN dt_file_status_history.file_id IS 'File ID (File Control)';
+COMMENT ON COLUMN dt_file_status_history.batch_id IS 'Batch ID (Batch Control)';
+COMMENT ON COLUMN dt_file_status_history.old_status IS 'Previous File Status';
+COMMENT ON COLUMN dt_file_status_history.new_status IS 'New File Status';
+COMMENT ON COLUMN dt_file_status_history.asof IS 'Date of the status change';
+
+COMMENT ON COLUMN dt_file_control.file_status IS 'File Status (R=Ready, J=JSON loaded, P=Posted, C=Complete, S=Skipped)';
+
+-- Batches from before completion_date was maintained were never marked complete;
+-- date them by their last file so that --resume doesn't pick them up
+UPDATE dt_batch_control AS bc
+SET completion_date = COALESCE(
+	(SELECT MAX(fc.asof) FROM dt_file_control fc WHERE fc.batch_id = bc.id),
+	bc.batch_date
+)
+WHERE bc.completion_date IS NULL;
+
+
+-- FUNCTION: fn_file_status_history()
+CREATE OR REPLACE FUNCTION fn_file_status_history()
+	RETURNS TRIGGER
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+DECLARE
+	previous CHAR(1);
+BEGIN
+	IF TG_OP = 'UPDATE' THEN
+		previous = OLD.file_status;
+	END IF;
+	INSERT INTO dt_file_status_history (
+		file_id, batch_id, old_status, new_status
+	) VALUES (
+		NEW.id, NEW.batch_id, previous, NEW.file_status
+	);
+	RETURN NEW;
+END; $$;
+
+
+-- TRIGGER: tra_file_status_history_ins - Calls fn_file_status_history()
+CREATE TRIGGER tra_file_status_history_ins
+	AFTER INSERT ON dt_file_control
+		FOR EACH ROW
+		WHEN (NEW.file_status IS NOT NULL)
+		EXECUTE PROCEDURE fn_file_status_history();
+
+-- TRIGGER: tra_file_status_history_upd - Calls fn_file_status_history()
+CREATE TRIGGER tra_file_status_history_upd
+	AFTER UPDATE OF file_status ON dt_file_control
+		FOR EACH ROW
+		WHEN (OLD.file_status IS DISTINCT FROM NEW.file_status)
+		EXECUTE PROCEDURE fn_file_status_history();
+
+COMMIT;
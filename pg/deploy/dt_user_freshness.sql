@@ -0,0 +1,109 @@
+-- Deploy acct_maint_2023:dt_user_freshness to pg
+-- requires: dt_user
+-- requires: dt_issue
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+-- TABLE: dt_user_freshness
+-- Narrow summary of dt_user.asof & dt_issue.asof, so classifying User IDs
+-- as cached / bad is an index-only join however wide dt_user gets
+-- The primary key covers both asof columns, for index-only scans
+CREATE TABLE dt_user_freshness (
+	user_id		BIGINT NOT NULL,
+	last_ok_asof	TIMESTAMPTZ,
+	last_issue_asof	TIMESTAMPTZ,
+	issue_kind	TEXT,
+	PRIMARY KEY (user_id) INCLUDE (last_ok_asof, last_issue_asof)
+);
+
+-- Comments
+COMMENT ON TABLE  dt_user_freshness IS 'User Freshness (maintained from dt_user & dt_issue by triggers)';
+COMMENT ON COLUMN dt_user_freshness.user_id IS 'Twitter User ID (Primary Key)';
+COMMENT ON COLUMN dt_user_freshness.last_ok_asof IS 'dt_user.asof';
+COMMENT ON COLUMN dt_user_freshness.last_issue_asof IS 'dt_issue.asof';
+COMMENT ON COLUMN dt_user_freshness.issue_kind IS 'no_user, no_response, no_tweets or other';
+
+
+-- FUNCTION: fn_user_freshness_user()
+CREATE OR REPLACE FUNCTION fn_user_freshness_user()
+	RETURNS TRIGGER
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+BEGIN
+	INSERT INTO dt_user_freshness AS uf (user_id, last_ok_asof)
+	SELECT user_id, MAX(asof) FROM new_users GROUP BY user_id
+	ON CONFLICT (user_id) DO UPDATE
+		SET last_ok_asof = EXCLUDED.last_ok_asof
+		WHERE uf.last_ok_asof IS DISTINCT FROM EXCLUDED.last_ok_asof;
+	RETURN NULL;
+END; $$;
+
+-- FUNCTION: fn_user_freshness_issue()
+CREATE OR REPLACE FUNCTION fn_user_freshness_issue()
+	RETURNS TRIGGER
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+BEGIN
+	INSERT INTO dt_user_freshness AS uf (user_id, last_issue_asof, issue_kind)
+	SELECT DISTINCT ON (user_id) user_id, asof,
+		CASE	WHEN no_user THEN 'no_user'
+			WHEN no_response THEN 'no_response'
+			WHEN no_tweets THEN 'no_tweets'
+			ELSE 'other' END
+	FROM new_issues
+	ORDER BY user_id, asof DESC
+	ON CONFLICT (user_id) DO UPDATE
+		SET last_issue_asof = EXCLUDED.last_issue_asof,
+		    issue_kind = EXCLUDED.issue_kind
+		WHERE (uf.last_issue_asof, uf.issue_kind)
+			IS DISTINCT FROM (EXCLUDED.last_issue_asof, EXCLUDED.issue_kind);
+	RETURN NULL;
+END; $$;
+
+
+-- TRIGGER: tra_user_freshness_ins - Calls fn_user_freshness_user()
+CREATE TRIGGER tra_user_freshness_ins
+	AFTER INSERT ON dt_user
+	REFERENCING NEW TABLE AS new_users
+		FOR EACH STATEMENT EXECUTE PROCEDURE fn_user_freshness_user();
+
+-- TRIGGER: tra_user_freshness_upd - Calls fn_user_freshness_user()
+CREATE TRIGGER tra_user_freshness_upd
+	AFTER UPDATE ON dt_user
+	REFERENCING NEW TABLE AS new_users
+		FOR EACH STATEMENT EXECUTE PROCEDURE fn_user_freshness_user();
+
+-- TRIGGER: tra_issue_freshness_ins - Calls fn_user_freshness_issue()
+CREATE TRIGGER tra_issue_freshness_ins
+	AFTER INSERT ON dt_issue
+	REFERENCING NEW TABLE AS new_issues
+		FOR EACH STATEMENT EXECUTE PROCEDURE fn_user_freshness_issue();
+
+-- TRIGGER: tra_issue_freshness_upd - Calls fn_user_freshness_issue()
+CREATE TRIGGER tra_issue_freshness_upd
+	AFTER UPDATE ON dt_issue
+	REFERENCING NEW TABLE AS new_issues
+		FOR EACH STATEMENT EXECUTE PROCEDURE fn_user_freshness_issue();
+
+
+-- Backfill
+INSERT INTO dt_user_freshness (user_id, last_ok_asof, last_issue_asof, issue_kind)
+SELECT	COALESCE(du.user_id, di.user_id),
+	du.asof,
+	di.asof,
+	CASE	WHEN di.user_id IS NULL THEN NULL
+		WHEN di.no_user THEN 'no_user'
+		WHEN di.no_response THEN 'no_response'
+		WHEN di.no_tweets THEN 'no_tweets'
+		ELSE 'other' END
+FROM	dt_user du
+FULL JOIN dt_issue di ON di.user_id = du.user_id;
+
+ANALYZE dt_user_freshness;
+
+COMMIT;
@@ -0,0 +1,154 @@
+-- Deploy acct_maint_2023:dt_user_freshness_refresh to pg
+-- requires: dt_user_freshness
+-- requires: dt_user_history
+-- requires: dt_user
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+ALTER TABLE dt_user_freshness ADD COLUMN next_refresh TIMESTAMPTZ;
+
+-- get_user_id_states() reads next_refresh, too, so the primary key covers it,
+-- to keep that lookup an index-only join
+ALTER TABLE dt_user_freshness
+	DROP CONSTRAINT dt_user_freshness_pkey,
+	ADD PRIMARY KEY (user_id) INCLUDE (last_ok_asof, last_issue_asof, next_refresh);
+
+COMMENT ON COLUMN dt_user_freshness.next_refresh IS 'When the profile is next due to be fetched';
+
+
+-- FUNCTION: fn_user_refresh_days()
+-- Days until a profile is worth fetching again: about 10 new tweets, a 5%
+-- change in followers, or twice the time since the last tweet, whichever
+-- comes first; clamped to [min_days, max_days].  NULL inputs are ignored.
+CREATE OR REPLACE FUNCTION fn_user_refresh_days (
+	statuses_per_day	NUMERIC,
+	followers_pct_per_day	NUMERIC,
+	days_since_tweet	NUMERIC,
+	min_days		NUMERIC DEFAULT 1,
+	max_days		NUMERIC DEFAULT 30
+) RETURNS NUMERIC
+	LANGUAGE SQL
+	IMMUTABLE
+AS $$
+	SELECT GREATEST(min_days, LEAST(
+		max_days,
+		10 / NULLIF(statuses_per_day, 0),
+		5 / NULLIF(followers_pct_per_day, 0),
+		2 * GREATEST(days_since_tweet, 0)
+	));
+$$;
+
+
+-- FUNCTION: fn_user_next_refresh()
+-- Recomputes next_refresh from dt_user_history over the last window_days:
+-- statuses_count velocity, followers_count change and last_tweeted recency.
+-- NULL in_user_ids means every user.
+CREATE OR REPLACE FUNCTION fn_user_next_refresh (
+	in_user_ids	BIGINT[] DEFAULT NULL,
+	window_days	INTEGER DEFAULT 90
+) RETURNS BIGINT
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+DECLARE
+	updated BIGINT;
+BEGIN
+	UPDATE dt_user_freshness AS uf
+	SET	next_refresh = uf.last_ok_asof + INTERVAL '1 day' * fn_user_refresh_days(
+			s.statuses_count_delta / s.span_days,
+			100.0 * s.followers_count_delta / GREATEST(s.followers_count_min, 1) / s.span_days,
+			EXTRACT(EPOCH FROM uf.last_ok_asof - du.last_tweeted) / 86400
+		)
+	FROM	dt_user du
+	LEFT JOIN (
+		SELECT	h.user_id,
+			(MAX(h.statuses_count) - MIN(h.statuses_count))::NUMERIC statuses_count_delta,
+			(MAX(h.followers_count) - MIN(h.followers_count))::NUMERIC followers_count_delta,
+			MIN(h.followers_count) followers_count_min,
+			GREATEST(EXTRACT(EPOCH FROM MAX(h.asof) - MIN(h.asof)) / 86400, 1) span_days
+		FROM	dt_user_history h
+		WHERE	(in_user_ids IS NULL OR h.user_id = ANY(in_user_ids))
+		  AND	h.asof > now() - make_interval(days => window_days)
+		GROUP BY h.user_id
+	) s ON s.user_id = du.user_id
+	WHERE	du.user_id = uf.user_id
+	  AND	uf.last_ok_asof IS NOT NULL
+	  AND	(in_user_ids IS NULL OR uf.user_id = ANY(in_user_ids));
+	GET DIAGNOSTICS updated = ROW_COUNT;
+	RETURN updated;
+END; $$;
+
+
+-- FUNCTION: fn_user_schedule_refresh()
+-- Batch step, run at the end of each run: schedules every user whose
+-- next_refresh was cleared by a fetch since the last one
+CREATE OR REPLACE FUNCTION fn_user_schedule_refresh (
+	window_days	INTEGER DEFAULT 90
+) RETURNS BIGINT
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+BEGIN
+	RETURN fn_user_next_refresh(
+		ARRAY(
+			SELECT	user_id FROM dt_user_freshness
+			WHERE	next_refresh IS NULL AND last_ok_asof IS NOT NULL
+		),
+		window_days
+	);
+END; $$;
+
+
+-- FUNCTION: fn_user_freshness_user() - now also clears the next refresh
+-- The schedule aggregates dt_user_history, which is too slow for every dt_user
+-- write, so it is left to fn_user_schedule_refresh(); until then the cache
+-- period applies
+CREATE OR REPLACE FUNCTION fn_user_freshness_user()
+	RETURNS TRIGGER
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+BEGIN
+	INSERT INTO dt_user_freshness AS uf (user_id, last_ok_asof)
+	SELECT user_id, MAX(asof) FROM new_users GROUP BY user_id
+	ON CONFLICT (user_id) DO UPDATE
+		SET last_ok_asof = EXCLUDED.last_ok_asof,
+		    next_refresh = NULL
+		WHERE uf.last_ok_asof IS DISTINCT FROM EXCLUDED.last_ok_asof;
+	RETURN NULL;
+END; $$;
+
+
+-- FUNCTION: fn_user_fetched()
+-- A profile fetched without changes is not written to dt_user (fn_user_insert()
+-- skips it), so the trigger above never sees it; record the fetch here instead
+CREATE OR REPLACE FUNCTION fn_user_fetched (
+	in_user_id	BIGINT,
+	in_asof		TIMESTAMPTZ
+) RETURNS TIMESTAMPTZ
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+DECLARE
+	out_last_ok_asof TIMESTAMPTZ;
+BEGIN
+	INSERT INTO dt_user_freshness AS uf (user_id, last_ok_asof)
+	VALUES (in_user_id, in_asof)
+	ON CONFLICT (user_id) DO UPDATE
+		SET last_ok_asof = GREATEST(uf.last_ok_asof, EXCLUDED.last_ok_asof),
+		    next_refresh = NULL
+		WHERE uf.last_ok_asof IS DISTINCT FROM GREATEST(uf.last_ok_asof, EXCLUDED.last_ok_asof);
+	SELECT last_ok_asof INTO out_last_ok_asof FROM dt_user_freshness WHERE user_id = in_user_id;
+	RETURN out_last_ok_asof;
+END; $$;
+
+
+-- Backfill
+SELECT fn_user_next_refresh();
+
+CREATE INDEX idx_user_freshness_next_refresh ON dt_user_freshness (next_refresh);
+
+COMMIT;
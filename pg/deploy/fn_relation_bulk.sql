@@ -0,0 +1,106 @@
+-- Deploy acct_maint_2023:fn_relation_bulk to pg
+-- requires: fn_relation
+-- requires: dt_relation_history
+-- requires: dt_relation
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+-- FUNCTION: fn_relation_history_bulk()
+-- Statement-level replacement for fn_relation_history(), so a bulk upsert
+-- writes its history rows in one INSERT instead of one per relation
+CREATE OR REPLACE FUNCTION fn_relation_history_bulk()
+	RETURNS TRIGGER
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+BEGIN
+	INSERT INTO dt_relation_history (
+		rel_id, user_id1, user_id2, asof,
+		follows, blocks, mutes
+	) SELECT
+		rel_id, user_id1, user_id2, asof,
+		follows, blocks, mutes
+	FROM new_relations
+	ON CONFLICT (user_id1, user_id2, asof) DO NOTHING;
+	RETURN NULL;
+END; $$;
+
+DROP TRIGGER tra_relation_history ON dt_relation;
+
+-- TRIGGER: tra_relation_history_ins - Calls fn_relation_history_bulk()
+CREATE TRIGGER tra_relation_history_ins
+	AFTER INSERT ON dt_relation
+	REFERENCING NEW TABLE AS new_relations
+		FOR EACH STATEMENT EXECUTE PROCEDURE fn_relation_history_bulk();
+
+-- TRIGGER: tra_relation_history_upd - Calls fn_relation_history_bulk()
+CREATE TRIGGER tra_relation_history_upd
+	AFTER UPDATE ON dt_relation
+	REFERENCING NEW TABLE AS new_relations
+		FOR EACH STATEMENT EXECUTE PROCEDURE fn_relation_history_bulk();
+
+
+-- FUNCTION: fn_relation_bulk()
+-- Same operations as fn_relation(), applied to a whole set of User IDs
+-- in one statement.  When incoming is true, the User IDs are the source
+-- of the relation (ie. followers) and in_acct_id is the target.
+CREATE OR REPLACE FUNCTION fn_relation_bulk (
+	operation	TEXT,
+	in_acct_id	BIGINT,
+	in_user_ids	BIGINT[],
+	in_asof		TIMESTAMPTZ,
+	incoming	BOOLEAN DEFAULT FALSE
+) RETURNS TABLE (
+	inserted	BIGINT,
+	updated		BIGINT,
+	unchanged	BIGINT
+) AS $$
+DECLARE
+	colname TEXT;
+	value BOOLEAN;
+	total BIGINT;
+BEGIN
+	operation = LOWER(operation);
+	CASE
+		WHEN operation = 'follow'   THEN colname = 'follows';	value = true;
+		WHEN operation = 'unfollow' THEN colname = 'follows';	value = false;
+		WHEN operation = 'mute'     THEN colname = 'mutes';	value = true;
+		WHEN operation = 'unmute'   THEN colname = 'mutes';	value = false;
+		WHEN operation = 'block'    THEN colname = 'blocks';	value = true;
+		WHEN operation = 'unblock'  THEN colname = 'blocks';	value = false;
+		ELSE RAISE EXCEPTION 'Unknown Operation: %', operation;
+	END CASE;
+
+	SELECT COUNT(DISTINCT u.id) INTO total FROM unnest(in_user_ids) u(id);
+
+	RETURN QUERY EXECUTE format($sql$
+		WITH upserted AS (
+			INSERT INTO dt_relation AS dr (user_id1, user_id2, asof, %1$I)
+			SELECT	CASE WHEN $4 THEN u.id ELSE $1 END,
+				CASE WHEN $4 THEN $1 ELSE u.id END,
+				$3, $5
+			FROM	(SELECT DISTINCT id FROM unnest($2) u(id)) u
+			ON CONFLICT (user_id1, user_id2) DO UPDATE
+				SET %1$I = EXCLUDED.%1$I, asof = EXCLUDED.asof
+				WHERE dr.%1$I IS NULL OR dr.%1$I != EXCLUDED.%1$I
+			RETURNING (xmax = 0) AS is_new
+		)
+		SELECT	COUNT(*) FILTER (WHERE is_new),
+			COUNT(*) FILTER (WHERE NOT is_new),
+			$6 - COUNT(*)
+		FROM	upserted;
+	$sql$, colname)
+	USING in_acct_id, in_user_ids, in_asof, incoming, value, total;
+END; $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMIT;
+
+
+/*
+SELECT * FROM fn_relation_bulk('follow', 105883359, ARRAY[12, 886832413]::BIGINT[], now());
+SELECT * FROM fn_relation_bulk('follow', 105883359, ARRAY[12, 886832413]::BIGINT[], now(), true);
+SELECT * FROM dt_relation_history ORDER BY hist_id DESC LIMIT 10;
+ */
@@ -0,0 +1,139 @@
+-- Deploy acct_maint_2023:fn_relation_merge to pg
+-- requires: fn_relation_bulk
+-- requires: dt_relation
+-- requires: dt_user
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+-- FUNCTION: fn_relation_merge()
+-- Applies a complete archive snapshot of one account's relations in one pass:
+-- every (user_id1, user_id2) pair gets its follows, blocks and mutes set by a
+-- single upsert, so it writes one history row instead of up to three.
+-- Pairs no longer in the snapshot are switched off by one UPDATE per direction.
+-- A NULL or empty array means that list is missing from the archive, so those
+-- columns are left as they are.  Only users already in dt_user are related.
+-- With in_prune false, the arrays are only part of the snapshot (eg. the users
+-- fetched so far), so nothing is switched off, and an empty array is a list
+-- that none of those users are in, rather than a missing one.
+CREATE OR REPLACE FUNCTION fn_relation_merge (
+	in_acct_id	BIGINT,
+	in_following	BIGINT[],
+	in_followers	BIGINT[],
+	in_blocking	BIGINT[],
+	in_muting	BIGINT[],
+	in_asof		TIMESTAMPTZ,
+	in_prune	BOOLEAN DEFAULT true
+) RETURNS TABLE (
+	inserted	BIGINT,
+	updated		BIGINT,
+	unchanged	BIGINT,
+	pruned		BIGINT
+) AS $$
+DECLARE
+	has_following BOOLEAN = COALESCE(cardinality(in_following) > 0 OR (in_following IS NOT NULL AND NOT in_prune), false);
+	has_followers BOOLEAN = COALESCE(cardinality(in_followers) > 0 OR (in_followers IS NOT NULL AND NOT in_prune), false);
+	has_blocking BOOLEAN = COALESCE(cardinality(in_blocking) > 0 OR (in_blocking IS NOT NULL AND NOT in_prune), false);
+	has_muting BOOLEAN = COALESCE(cardinality(in_muting) > 0 OR (in_muting IS NOT NULL AND NOT in_prune), false);
+	total BIGINT;
+	outgoing_pruned BIGINT;
+	incoming_pruned BIGINT;
+BEGIN
+	CREATE TEMP TABLE tmp_relation_merge ON COMMIT DROP AS
+	SELECT	CASE WHEN s.incoming THEN s.id ELSE in_acct_id END user_id1,
+		CASE WHEN s.incoming THEN in_acct_id ELSE s.id END user_id2,
+		CASE WHEN s.incoming THEN true
+			WHEN has_following THEN bool_or(s.src = 'following') END follows,
+		CASE WHEN s.incoming THEN NULL
+			WHEN has_blocking THEN bool_or(s.src = 'blocking') END blocks,
+		CASE WHEN s.incoming THEN NULL
+			WHEN has_muting THEN bool_or(s.src = 'muting') END mutes
+	FROM (
+		SELECT u.id, 'following' src, false incoming FROM unnest(in_following) u(id)
+		UNION ALL
+		SELECT u.id, 'blocking', false FROM unnest(in_blocking) u(id)
+		UNION ALL
+		SELECT u.id, 'muting', false FROM unnest(in_muting) u(id)
+		UNION ALL
+		SELECT u.id, 'follower', true FROM unnest(in_followers) u(id)
+	) s
+	GROUP BY s.id, s.incoming;
+
+	-- Pairs whose other user isn't in dt_user are skipped, so they aren't unchanged
+	SELECT	COUNT(*) INTO total
+	FROM	tmp_relation_merge t
+	JOIN	dt_user du
+	  ON	du.user_id = CASE WHEN t.user_id1 = in_acct_id THEN t.user_id2 ELSE t.user_id1 END;
+
+	WITH upserted AS (
+		INSERT INTO dt_relation AS dr (user_id1, user_id2, asof, follows, blocks, mutes)
+		SELECT	t.user_id1, t.user_id2, in_asof, t.follows, t.blocks, t.mutes
+		FROM	tmp_relation_merge t
+		JOIN	dt_user du
+		  ON	du.user_id = CASE WHEN t.user_id1 = in_acct_id THEN t.user_id2 ELSE t.user_id1 END
+		ON CONFLICT (user_id1, user_id2) DO UPDATE
+			SET	follows = COALESCE(EXCLUDED.follows, dr.follows),
+				blocks = COALESCE(EXCLUDED.blocks, dr.blocks),
+				mutes = COALESCE(EXCLUDED.mutes, dr.mutes),
+				asof = EXCLUDED.asof
+			WHERE (dr.follows, dr.blocks, dr.mutes) IS DISTINCT FROM (
+				COALESCE(EXCLUDED.follows, dr.follows),
+				COALESCE(EXCLUDED.blocks, dr.blocks),
+				COALESCE(EXCLUDED.mutes, dr.mutes)
+			)
+		RETURNING (xmax = 0) AS is_new
+	)
+	SELECT	COUNT(*) FILTER (WHERE is_new),
+		COUNT(*) FILTER (WHERE NOT is_new),
+		total - COUNT(*)
+	INTO	inserted, updated, unchanged
+	FROM	upserted;
+
+	pruned = 0;
+	IF NOT in_prune THEN
+		DROP TABLE tmp_relation_merge;
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	-- Outgoing pairs no longer followed/blocked/muted
+	UPDATE dt_relation AS dr
+	SET	follows = CASE WHEN has_following AND dr.follows THEN false ELSE dr.follows END,
+		blocks = CASE WHEN has_blocking AND dr.blocks THEN false ELSE dr.blocks END,
+		mutes = CASE WHEN has_muting AND dr.mutes THEN false ELSE dr.mutes END,
+		asof = in_asof
+	WHERE dr.user_id1 = in_acct_id
+	  AND ((has_following AND dr.follows) OR (has_blocking AND dr.blocks) OR (has_muting AND dr.mutes))
+	  AND NOT EXISTS (
+		SELECT 1 FROM tmp_relation_merge t
+		WHERE t.user_id1 = in_acct_id AND t.user_id2 = dr.user_id2
+	  );
+	GET DIAGNOSTICS outgoing_pruned = ROW_COUNT;
+
+	-- Incoming pairs no longer following
+	UPDATE dt_relation AS dr
+	SET	follows = false,
+		asof = in_asof
+	WHERE has_followers
+	  AND dr.user_id2 = in_acct_id
+	  AND dr.follows
+	  AND NOT EXISTS (
+		SELECT 1 FROM tmp_relation_merge t
+		WHERE t.user_id2 = in_acct_id AND t.user_id1 = dr.user_id1
+	  );
+	GET DIAGNOSTICS incoming_pruned = ROW_COUNT;
+
+	pruned = outgoing_pruned + incoming_pruned;
+	DROP TABLE tmp_relation_merge;
+	RETURN NEXT;
+END; $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMIT;
+
+
+/*
+SELECT * FROM fn_relation_merge(105883359, ARRAY[12]::BIGINT[], ARRAY[886832413]::BIGINT[], NULL, NULL, now());
+SELECT * FROM dt_relation_history ORDER BY hist_id DESC LIMIT 10;
+ */
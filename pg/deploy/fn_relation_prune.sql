@@ -0,0 +1,57 @@
+-- Deploy acct_maint_2023:fn_relation_prune to pg
+-- requires: fn_relation_bulk
+-- requires: dt_relation
+-- requires: devschema
+
+BEGIN;
+
+SET search_path TO development;
+
+-- FUNCTION: fn_relation_prune()
+-- Applies unfollow/unblock/unmute to every relation of in_acct_id that is
+-- no longer in the current snapshot (in_user_ids), in one statement.
+-- When incoming is true, the snapshot holds the sources of the relation
+-- (ie. followers).  An empty snapshot is treated as missing data.
+CREATE OR REPLACE FUNCTION fn_relation_prune (
+	operation	TEXT,
+	in_acct_id	BIGINT,
+	in_user_ids	BIGINT[],
+	in_asof		TIMESTAMPTZ,
+	incoming	BOOLEAN DEFAULT FALSE
+) RETURNS BIGINT AS $$
+DECLARE
+	colname TEXT;
+	acct_col TEXT = 'user_id1';
+	user_col TEXT = 'user_id2';
+	pruned BIGINT;
+BEGIN
+	operation = LOWER(operation);
+	CASE
+		WHEN operation IN ('follow', 'unfollow') THEN colname = 'follows';
+		WHEN operation IN ('mute', 'unmute')     THEN colname = 'mutes';
+		WHEN operation IN ('block', 'unblock')   THEN colname = 'blocks';
+		ELSE RAISE EXCEPTION 'Unknown Operation: %', operation;
+	END CASE;
+	IF COALESCE(cardinality(in_user_ids), 0) = 0 THEN
+		RETURN 0;
+	END IF;
+	IF incoming THEN
+		acct_col = 'user_id2';
+		user_col = 'user_id1';
+	END IF;
+
+	EXECUTE format($sql$
+		UPDATE dt_relation AS dr
+		SET %1$I = false, asof = $3
+		WHERE dr.%2$I = $1
+		  AND dr.%1$I
+		  AND NOT EXISTS (
+			SELECT 1 FROM unnest($2) u(id) WHERE u.id = dr.%3$I
+		  );
+	$sql$, colname, acct_col, user_col)
+	USING in_acct_id, in_user_ids, in_asof;
+	GET DIAGNOSTICS pruned = ROW_COUNT;
+	RETURN pruned;
+END; $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMIT;
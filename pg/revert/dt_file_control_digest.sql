@@ -0,0 +1,14 @@
+-- Revert acct_maint_2023:dt_file_control_digest from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+DROP INDEX idx_file_digest_size;
+
+ALTER TABLE dt_file_control
+	DROP COLUMN skipped_for,
+	DROP COLUMN digest,
+	DROP COLUMN file_size;
+
+COMMIT;
@@ -0,0 +1,12 @@
+-- Revert acct_maint_2023:dt_file_control_rows from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+ALTER TABLE dt_file_control
+	DROP COLUMN rows_inserted,
+	DROP COLUMN rows_updated,
+	DROP COLUMN rows_unchanged;
+
+COMMIT;
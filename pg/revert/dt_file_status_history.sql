@@ -0,0 +1,15 @@
+-- Revert acct_maint_2023:dt_file_status_history from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+DROP TRIGGER tra_file_status_history_upd ON dt_file_control;
+DROP TRIGGER tra_file_status_history_ins ON dt_file_control;
+DROP FUNCTION fn_file_status_history;
+
+DROP TABLE dt_file_status_history CASCADE;
+
+COMMENT ON COLUMN dt_file_control.file_status IS 'File Status';
+
+COMMIT;
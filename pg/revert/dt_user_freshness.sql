@@ -0,0 +1,16 @@
+-- Revert acct_maint_2023:dt_user_freshness from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+DROP TRIGGER tra_issue_freshness_upd ON dt_issue;
+DROP TRIGGER tra_issue_freshness_ins ON dt_issue;
+DROP TRIGGER tra_user_freshness_upd ON dt_user;
+DROP TRIGGER tra_user_freshness_ins ON dt_user;
+DROP FUNCTION fn_user_freshness_issue;
+DROP FUNCTION fn_user_freshness_user;
+
+DROP TABLE dt_user_freshness;
+
+COMMIT;
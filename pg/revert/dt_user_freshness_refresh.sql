@@ -0,0 +1,33 @@
+-- Revert acct_maint_2023:dt_user_freshness_refresh from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+-- FUNCTION: fn_user_freshness_user() - as deployed by dt_user_freshness
+CREATE OR REPLACE FUNCTION fn_user_freshness_user()
+	RETURNS TRIGGER
+	LANGUAGE plpgsql
+	SECURITY DEFINER
+AS $$
+BEGIN
+	INSERT INTO dt_user_freshness AS uf (user_id, last_ok_asof)
+	SELECT user_id, MAX(asof) FROM new_users GROUP BY user_id
+	ON CONFLICT (user_id) DO UPDATE
+		SET last_ok_asof = EXCLUDED.last_ok_asof
+		WHERE uf.last_ok_asof IS DISTINCT FROM EXCLUDED.last_ok_asof;
+	RETURN NULL;
+END; $$;
+
+DROP FUNCTION fn_user_fetched;
+DROP FUNCTION fn_user_schedule_refresh;
+DROP FUNCTION fn_user_next_refresh;
+DROP FUNCTION fn_user_refresh_days;
+
+DROP INDEX idx_user_freshness_next_refresh;
+ALTER TABLE dt_user_freshness
+	DROP CONSTRAINT dt_user_freshness_pkey,
+	ADD PRIMARY KEY (user_id) INCLUDE (last_ok_asof, last_issue_asof);
+ALTER TABLE dt_user_freshness DROP COLUMN next_refresh;
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Revert acct_maint_2023:fn_relation_bulk from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+DROP FUNCTION fn_relation_bulk;
+
+DROP TRIGGER tra_relation_history_upd ON dt_relation;
+DROP TRIGGER tra_relation_history_ins ON dt_relation;
+DROP FUNCTION fn_relation_history_bulk;
+
+-- TRIGGER: tra_relation_history - Calls fn_relation_history()
+CREATE OR REPLACE TRIGGER tra_relation_history
+	AFTER INSERT OR UPDATE ON dt_relation
+		FOR EACH ROW EXECUTE PROCEDURE fn_relation_history();
+
+COMMIT;
@@ -0,0 +1,9 @@
+-- Revert acct_maint_2023:fn_relation_prune from pg
+
+BEGIN;
+
+SET search_path TO development;
+
+DROP FUNCTION fn_relation_prune;
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Verify acct_maint_2023:dt_file_control_digest on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+SELECT id, file_size, digest, skipped_for
+FROM dt_file_control
+WHERE FALSE;
+
+SELECT 1/count(*) FROM pg_indexes WHERE indexname = 'idx_file_digest_size';
+
+ROLLBACK;
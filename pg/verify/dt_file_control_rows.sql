@@ -0,0 +1,11 @@
+-- Verify acct_maint_2023:dt_file_control_rows on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+SELECT id, db_rows, rows_inserted, rows_updated, rows_unchanged
+FROM dt_file_control
+WHERE FALSE;
+
+ROLLBACK;
@@ -0,0 +1,17 @@
+-- Verify acct_maint_2023:dt_file_status_history on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+-- Verify dt_file_status_history table
+SELECT hist_id, file_id, batch_id, old_status, new_status, asof
+FROM dt_file_status_history
+WHERE FALSE;
+
+SELECT has_function_privilege('fn_file_status_history()', 'execute');
+
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_file_status_history_ins';
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_file_status_history_upd';
+
+ROLLBACK;
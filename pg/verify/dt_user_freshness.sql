@@ -0,0 +1,20 @@
+-- Verify acct_maint_2023:dt_user_freshness on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+-- Verify dt_user_freshness table
+SELECT user_id, last_ok_asof, last_issue_asof, issue_kind
+FROM dt_user_freshness
+WHERE FALSE;
+
+SELECT has_function_privilege('fn_user_freshness_user()', 'execute');
+SELECT has_function_privilege('fn_user_freshness_issue()', 'execute');
+
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_user_freshness_ins';
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_user_freshness_upd';
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_issue_freshness_ins';
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_issue_freshness_upd';
+
+ROLLBACK;
@@ -0,0 +1,16 @@
+-- Verify acct_maint_2023:dt_user_freshness_refresh on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+SELECT user_id, next_refresh
+FROM dt_user_freshness
+WHERE FALSE;
+
+SELECT 1/COUNT(*) proacl FROM pg_proc WHERE proname='fn_user_refresh_days';
+SELECT 1/COUNT(*) proacl FROM pg_proc WHERE proname='fn_user_next_refresh';
+SELECT 1/COUNT(*) proacl FROM pg_proc WHERE proname='fn_user_fetched';
+SELECT 1/COUNT(*) proacl FROM pg_proc WHERE proname='fn_user_schedule_refresh';
+
+ROLLBACK;
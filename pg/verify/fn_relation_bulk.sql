@@ -0,0 +1,13 @@
+-- Verify acct_maint_2023:fn_relation_bulk on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+SELECT 1/COUNT(*) proacl FROM pg_proc WHERE proname='fn_relation_bulk';
+SELECT has_function_privilege('fn_relation_history_bulk()', 'execute');
+
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_relation_history_ins';
+SELECT 1/count(*) FROM pg_trigger WHERE tgname = 'tra_relation_history_upd';
+
+ROLLBACK;
@@ -0,0 +1,9 @@
+-- Verify acct_maint_2023:fn_relation_prune on pg
+
+BEGIN;
+
+SET search_path TO development;
+
+SELECT 1/COUNT(*) proacl FROM pg_proc WHERE proname='fn_relation_prune';
+
+ROLLBACK;